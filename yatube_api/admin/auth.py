@@ -1,10 +1,15 @@
 from datetime import datetime
+from fastapi import HTTPException
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
 
 from config import settings
-from users.auth import authenticate_user, create_token, get_token_payload
+from users.auth import (authenticate_user, create_token, get_token_payload,
+                        token_claims)
 from users.models import UsersDAO
+from users.tokens import start_family
+
+ADMIN_ROLES = ('moderator', 'admin', 'root')
 
 
 class AdminAuth(AuthenticationBackend):
@@ -13,11 +18,14 @@ class AdminAuth(AuthenticationBackend):
         email, password = form['username'], form['password']
 
         user = await authenticate_user(email, password)
-        if user and user.role in ('moderator', 'admin', 'root'):
+        if user and user.role in ADMIN_ROLES:
             await UsersDAO.update(model_id=user.id,
                                   last_login=datetime.utcnow())
-            access_token = create_token(data={'sub': str(user.email)},
-                                        token_type='access')
+            # A family lets the admin session be revoked with the others.
+            family = await start_family(user.id)
+            access_token = create_token(
+                data=token_claims(user) | {'fam': family['fam']},
+                token_type='access')
             request.session.update({'token': access_token, 'role': user.role})
             return True
 
@@ -32,11 +40,17 @@ class AdminAuth(AuthenticationBackend):
         if not token or not role:
             return False
 
-        token_data = await get_token_payload(token=token)
-        if token_data and token_data['sub']:
-            user = await UsersDAO.find_one_or_none(email=token_data['sub'])
-            if user and user.role == role:
-                return True
+        # Verified tokens are cached, so page loads skip decoding.
+        try:
+            token_data = await get_token_payload(token=token)
+        except HTTPException:
+            return False
+        if token_data.role is not None:
+            return token_data.role == role and role in ADMIN_ROLES
+
+        user = await UsersDAO.find_by_email(token_data.sub)
+        if user and user.role == role:
+            return True
 
 
 authentication_backend = AdminAuth(secret_key=settings.SECRET_KEY)
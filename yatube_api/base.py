@@ -1,17 +1,133 @@
-from sqlalchemy import select, insert, update, func
-from sqlalchemy.orm import joinedload
+from contextlib import asynccontextmanager
+from collections import Counter
+from sqlalchemy import (select, insert, update, delete, func, literal, text,
+                        tuple_, inspect, bindparam)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased, joinedload, ONETOMANY, MANYTOONE
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
-from database import async_session_maker
+from database import async_session_maker, current_session
 
+from conditions import OPERATORS
 from config import settings
+from counters import count_cache, EXACT, CACHED, ESTIMATED
+from pagination import NEXT, PREVIOUS, decode_cursor, make_page
+
+# Dialect inserts support ON CONFLICT clauses.
+DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
 
 
 class BaseDAO:
     model = None
+    keyset = ('id',)
+    keyset_descending = False
+    search_index = None
+    # Public filter name -> (column, operator) for compile_filters().
+    filters = {}
+    # Public ordering name -> (keyset columns, descending).
+    orderings = {}
+    # (foreign key column, target model, counter column) kept in sync with
+    # the number of rows pointing at each target.
+    counters = ()
+
+    @staticmethod
+    @asynccontextmanager
+    async def session():
+        session = current_session.get()
+        if session is not None:
+            yield session
+        else:
+            async with async_session_maker() as session:
+                yield session
+
+    @staticmethod
+    async def commit(session):
+        if session is current_session.get():
+            await session.flush()
+        else:
+            await session.commit()
+
+    @classmethod
+    def conditions(cls, filters=None, **filter_by) -> tuple:
+        conditions = [(column, 'eq', value)
+                      for column, value in filter_by.items()]
+        for name, value in (filters or {}).items():
+            if value is not None:
+                column, op = cls.filters[name]
+                conditions.append((column, op, value))
+        return tuple(conditions)
+
+    @classmethod
+    def compile_conditions(cls, conditions) -> list:
+        return [OPERATORS[op](getattr(cls.model, column), value)
+                for column, op, value in conditions]
+
+    @classmethod
+    def compile_filters(cls, filters=None) -> list:
+        return cls.compile_conditions(cls.conditions(filters))
+
+    @classmethod
+    def keyset_types(cls, keyset=None) -> list[type]:
+        return [getattr(cls.model, name).type.python_type
+                for name in keyset or cls.keyset]
+
+    @classmethod
+    def keyset_for(cls, ordering: str | None = None):
+        if ordering is None:
+            return cls.keyset, cls.keyset_descending
+        return cls.orderings[ordering]
+
+    @classmethod
+    def projection(cls, *fields):
+        # Fields are column names, '*', dotted paths through relationships
+        # ('author.username') or (label, path) pairs.
+        columns, joins, entities = [], [], {(): cls.model}
+        for field in fields:
+            label, path = field if isinstance(field, tuple) else (None, field)
+            if path == '*':
+                columns.extend(
+                    getattr(cls.model, attribute.key)
+                    for attribute in inspect(cls.model).column_attrs)
+                continue
+
+            *relations, name = path.split('.')
+            for index in range(1, len(relations) + 1):
+                if tuple(relations[:index]) in entities:
+                    continue
+                relation = getattr(entities[tuple(relations[:index - 1])],
+                                   relations[index - 1])
+                entity = aliased(relation.property.mapper.class_)
+                entities[tuple(relations[:index])] = entity
+                joins.append(relation.of_type(entity))
+
+            column = getattr(entities[tuple(relations)], name)
+            columns.append(column.label(label or path.replace('.', '_')))
+        return {'columns': tuple(columns), 'joins': tuple(joins)}
+
+    @classmethod
+    def select_query(cls, options, columns=None, joins=(), **filter_by):
+        # With `columns` the query yields plain rows instead of instances.
+        if columns is None:
+            query = select(cls.model).filter_by(**filter_by)
+            for option in options:
+                query = query.options(joinedload(getattr(cls.model, option)))
+            return query
+
+        query = select(*columns).select_from(cls.model).filter_by(**filter_by)
+        for join in joins:
+            query = query.outerjoin(join)
+        return query
+
+    @staticmethod
+    def fetch_all(result, columns=None):
+        if columns is None:
+            return result.unique().scalars().all()
+        return result.all()
 
     @classmethod
     async def find_one_or_none(cls, *options, **filter_by):
-        async with async_session_maker() as session:
+        async with cls.session() as session:
             query = select(cls.model).filter_by(**filter_by)
 
             for option in options:
@@ -21,9 +137,17 @@ class BaseDAO:
             return result.scalar_one_or_none()
 
     @classmethod
-    async def find_all(cls, *options, **filter_by):
-        async with async_session_maker() as session:
-            query = select(cls.model).filter_by(**filter_by)
+    async def find_all(cls, *options, columns=None, joins=(), **filter_by):
+        async with cls.session() as session:
+            query = cls.select_query(options, columns, joins, **filter_by)
+
+            result = await session.execute(query)
+            return cls.fetch_all(result, columns)
+
+    @classmethod
+    async def find_all_by_ids(cls, ids, *options):
+        async with cls.session() as session:
+            query = select(cls.model).where(cls.model.id.in_(ids))
 
             for option in options:
                 query = query.options(joinedload(getattr(cls.model, option)))
@@ -37,73 +161,435 @@ class BaseDAO:
         *options,
         offset: int = 0,
         limit: int = settings.PAGINATION_DEFAULT_LIMIT,
+        columns=None,
+        joins=(),
+        filters=None,
+        ordering: str | None = None,
+        **filter_by
+    ):
+        async with cls.session() as session:
+            query = (
+                cls.select_query(options, columns, joins, **filter_by)
+                .where(*cls.compile_filters(filters))
+                .offset(offset)
+                .limit(limit)
+            )
+            if ordering is not None:
+                keyset, descending = cls.keyset_for(ordering)
+                query = query.order_by(*(
+                    getattr(cls.model, name).desc() if descending
+                    else getattr(cls.model, name).asc()
+                    for name in keyset
+                ))
+
+            result = await session.execute(query)
+            return cls.fetch_all(result, columns)
+
+    @classmethod
+    async def find_all_with_keyset(
+        cls,
+        *options,
+        cursor: str | None = None,
+        limit: int = settings.PAGINATION_DEFAULT_LIMIT,
+        where=(),
+        columns=None,
+        joins=(),
+        filters=None,
+        ordering: str | None = None,
         **filter_by
     ):
+        keyset, keyset_descending = cls.keyset_for(ordering)
+        keys = [getattr(cls.model, name) for name in keyset]
+        direction, values = NEXT, None
+        if cursor:
+            direction, values = decode_cursor(cursor,
+                                              cls.keyset_types(keyset))
+
+        backwards = direction == PREVIOUS
+        descending = keyset_descending != backwards
+
+        async with cls.session() as session:
+            query = cls.select_query(options, columns, joins, **filter_by)
+            query = query.where(*where, *cls.compile_filters(filters))
+
+            if values is not None:
+                key = tuple_(*keys)
+                bound = tuple_(*(literal(value, column.type)
+                                 for column, value in zip(keys, values)))
+                query = query.where(key < bound if descending
+                                    else key > bound)
+
+            query = query.order_by(
+                *(column.desc() if descending else column.asc()
+                  for column in keys)
+            ).limit(limit + 1)
+
+            result = await session.execute(query)
+            items = list(cls.fetch_all(result, columns))
+
+        has_more = len(items) > limit
+        items = items[:limit]
+        if backwards:
+            items.reverse()
+
+        return make_page(items, keyset, direction, values is not None,
+                         has_more)
+
+    @classmethod
+    async def stream_all(cls, *options, **filter_by):
+        # The stream outlives the request, so it always gets its own session.
         async with async_session_maker() as session:
             query = (
                 select(cls.model)
                 .filter_by(**filter_by)
-                .offset(offset)
-                .limit(limit)
+                .order_by(*(getattr(cls.model, name) for name in cls.keyset))
+                .execution_options(yield_per=settings.STREAM_BATCH_SIZE)
             )
 
             for option in options:
                 query = query.options(joinedload(getattr(cls.model, option)))
 
-            result = await session.execute(query)
-            return result.unique().scalars().all()
+            result = await session.stream(query)
+            async for record in result.scalars():
+                yield record
 
     @classmethod
-    async def get_total_count(cls):
-        async with async_session_maker() as session:
-            query = select(func.count()).select_from(cls.model)
+    async def get_total_count(cls, filters=None, **filter_by):
+        conditions = cls.conditions(filters, **filter_by)
+        async with cls.session() as session:
+            query = (
+                select(func.count())
+                .select_from(cls.model)
+                .where(*cls.compile_conditions(conditions))
+            )
             result = await session.execute(query)
-            return result.scalar()
+            total_count = result.scalar()
+
+        count_cache.set(cls.model, conditions, total_count,
+                        settings.COUNT_CACHE_TTL)
+        return total_count
+
+    @classmethod
+    async def get_estimated_count(cls):
+        async with cls.session() as session:
+            if session.bind.dialect.name == 'postgresql':
+                query = text('SELECT reltuples::bigint FROM pg_class '
+                             'WHERE relname = :name')
+                result = await session.execute(
+                    query, {'name': cls.model.__tablename__})
+                estimate = result.scalar()
+                if estimate is not None and estimate >= 0:
+                    return estimate
+
+            result = await session.execute(select(func.max(cls.model.id)))
+            return result.scalar() or 0
+
+    @classmethod
+    async def get_count(cls, mode: str = None, filters=None, **filter_by):
+        mode = mode or settings.COUNT_DEFAULT_MODE
+        conditions = cls.conditions(filters, **filter_by)
+
+        if mode == CACHED:
+            cached_count = count_cache.get(cls.model, conditions)
+            if cached_count is not None:
+                return cached_count, CACHED
+
+        if mode == ESTIMATED:
+            cached_count = count_cache.get(cls.model, conditions, fresh=False)
+            if cached_count is not None:
+                return cached_count, ESTIMATED
+            if not conditions:
+                return await cls.get_estimated_count(), ESTIMATED
+
+        return await cls.get_total_count(filters, **filter_by), EXACT
+
+    @classmethod
+    async def populate_related(cls, session, records, options):
+        # Fill many-to-one relationships from the session identity map and
+        # fetch whatever is missing with one query per relationship.
+        for option in options:
+            relationship = getattr(cls.model, option).property
+            if relationship.direction is not MANYTOONE:
+                for record in records:
+                    await session.refresh(record, [option])
+                continue
+
+            target = relationship.mapper.class_
+            (local, remote), = relationship.local_remote_pairs
+            keys = {getattr(record, local.key) for record in records}
+            keys.discard(None)
+
+            related, missing = {}, []
+            for key in keys:
+                instance = session.identity_map.get(identity_key(target, key))
+                if instance is None:
+                    missing.append(key)
+                else:
+                    related[key] = instance
+
+            if missing:
+                result = await session.execute(
+                    select(target).where(remote.in_(missing)))
+                for instance in result.scalars().all():
+                    related[getattr(instance, remote.key)] = instance
+
+            for record in records:
+                set_committed_value(record, option,
+                                    related.get(getattr(record, local.key)))
+
+    @classmethod
+    async def adjust_counters(cls, session, records, sign: int):
+        for column, target, counter in cls.counters:
+            deltas = Counter(getattr(record, column) for record in records)
+            deltas.pop(None, None)
+            if not deltas:
+                continue
+
+            table = target.__table__
+            # Relative updates stay correct under concurrent writers.
+            await session.execute(
+                update(table)
+                .where(table.c.id == bindparam('target_id'))
+                .values({counter: table.c[counter] + bindparam('delta')}),
+                [{'target_id': target_id, 'delta': sign * delta}
+                 for target_id, delta in deltas.items()]
+            )
+            cls.counters_changed(target, set(deltas))
+
+    @classmethod
+    def counters_changed(cls, target, ids):
+        # Core updates bypass the ORM, DAOs caching the targets evict them.
+        pass
+
+    @classmethod
+    async def reconcile_counters(
+        cls, batch_size: int = settings.COUNTER_RECONCILE_BATCH_SIZE
+    ) -> int:
+        repaired = 0
+        for column, target, counter in cls.counters:
+            table = target.__table__
+            actual = (
+                select(func.count())
+                .select_from(cls.model.__table__)
+                .where(cls.model.__table__.c[column] == table.c.id)
+                .scalar_subquery()
+            )
+            last_id = 0
+            while True:
+                # One transaction per batch keeps locks short.
+                async with cls.session() as session:
+                    result = await session.execute(
+                        select(table.c.id)
+                        .where(table.c.id > last_id)
+                        .order_by(table.c.id)
+                        .limit(batch_size)
+                    )
+                    ids = result.scalars().all()
+                    if not ids:
+                        break
+
+                    result = await session.execute(
+                        update(table)
+                        .where(table.c.id.in_(ids),
+                               table.c[counter] != actual)
+                        .values({counter: actual})
+                    )
+                    repaired += result.rowcount
+                    await cls.commit(session)
+                if result.rowcount:
+                    cls.counters_changed(target, set(ids))
+                last_id = ids[-1]
+        return repaired
+
+    @classmethod
+    async def refresh_search(cls, session, ids):
+        if cls.search_index is not None:
+            await cls.search_index.refresh(session, ids)
+
+    @classmethod
+    async def search(
+        cls,
+        query: str,
+        offset: int = 0,
+        limit: int = settings.PAGINATION_DEFAULT_LIMIT,
+        columns=None,
+        joins=(),
+        where=()
+    ):
+        async with cls.session() as session:
+            return await cls.search_index.search(
+                session, query, columns or (cls.model.id,), joins=joins,
+                where=where, offset=offset, limit=limit)
 
     @classmethod
     async def add(cls, *options, **data):
-        async with async_session_maker() as session:
+        async with cls.session() as session:
             query = insert(cls.model).values(**data).returning(cls.model)
             result = await session.execute(query)
-            await session.commit()
-
             added_record = result.scalar_one()
+            await cls.populate_related(session, [added_record], options)
+            await cls.refresh_search(session, [added_record.id])
+            await cls.adjust_counters(session, [added_record], 1)
+            await cls.commit(session)
+
+            count_cache.adjust(cls.model, added_record, 1)
+            return added_record
+
+    @classmethod
+    async def add_or_ignore(cls, *options, **data):
+        # Returns None instead of raising when a unique constraint matches.
+        async with cls.session() as session:
+            query = (
+                DIALECT_INSERTS[session.bind.dialect.name](cls.model)
+                .values(**data)
+                .on_conflict_do_nothing()
+                .returning(cls.model)
+            )
+            result = await session.execute(query)
+            added_record = result.scalar_one_or_none()
+            if added_record is None:
+                return None
 
-            if options:
-                query = select(cls.model).filter_by(id=added_record.id)
-                for option in options:
-                    query = query.options(joinedload(getattr(cls.model,
-                                                             option)))
-                result = await session.execute(query)
-                added_record = result.unique().scalar_one()
+            await cls.populate_related(session, [added_record], options)
+            await cls.refresh_search(session, [added_record.id])
+            await cls.adjust_counters(session, [added_record], 1)
+            await cls.commit(session)
 
+            count_cache.adjust(cls.model, added_record, 1)
             return added_record
 
     @classmethod
     async def update(cls, model_id: int, *options, **data):
-        async with async_session_maker() as session:
+        async with cls.session() as session:
             query = (
                 update(cls.model)
                 .where(cls.model.id == model_id)
                 .values(**data)
+                .returning(cls.model)
+                .execution_options(populate_existing=True)
             )
-            await session.execute(query)
-            await session.commit()
-
-            query = select(cls.model).where(cls.model.id == model_id)
-
-            for option in options:
-                query = query.options(joinedload(getattr(cls.model, option)))
-
             result = await session.execute(query)
             updated_instance = result.scalar_one_or_none()
+            if updated_instance is not None:
+                await cls.populate_related(session, [updated_instance],
+                                           options)
+            await cls.refresh_search(session, [model_id])
+            await cls.commit(session)
 
+            count_cache.discard(cls.model, data)
             return updated_instance
 
     @classmethod
     async def delete(cls, model_id: int):
-        async with async_session_maker() as session:
+        async with cls.session() as session:
             post = await session.get(cls.model, model_id)
             await session.delete(post)
-            await session.commit()
+            await cls.adjust_counters(session, [post], -1)
+            await cls.commit(session)
+            count_cache.adjust(cls.model, post, -1)
+
+    @classmethod
+    async def delete_by(cls, **filter_by):
+        # Unlike delete_many(), children are not detached first.
+        async with cls.session() as session:
+            query = (
+                delete(cls.model)
+                .filter_by(**filter_by)
+                .returning(cls.model)
+            )
+            result = await session.execute(query)
+            deleted_records = result.scalars().all()
+            await cls.refresh_search(
+                session, [record.id for record in deleted_records])
+            await cls.adjust_counters(session, deleted_records, -1)
+            await cls.commit(session)
+
+        for deleted_record in deleted_records:
+            count_cache.adjust(cls.model, deleted_record, -1)
+        return deleted_records
+
+    @classmethod
+    async def add_many(cls, rows: list[dict], *options):
+        if not rows:
+            return []
+
+        async with cls.session() as session:
+            query = insert(cls.model).returning(cls.model)
+            result = await session.execute(query, rows)
+
+            # Asking SQLAlchemy to keep parameter order makes it fall back to
+            # one INSERT per row on SQLite; autoincrement ids follow the
+            # order of the multi-row VALUES clause, so sort by id instead.
+            added_records = sorted(result.scalars().all(),
+                                   key=lambda record: record.id)
+            await cls.populate_related(session, added_records, options)
+            await cls.refresh_search(
+                session, [record.id for record in added_records])
+            await cls.adjust_counters(session, added_records, 1)
+            await cls.commit(session)
+
+            for added_record in added_records:
+                count_cache.adjust(cls.model, added_record, 1)
+            return added_records
+
+    @classmethod
+    async def update_many(cls, rows: list[dict], *options):
+        if not rows:
+            return []
+
+        async with cls.session() as session:
+            await session.execute(update(cls.model), rows)
+            await cls.refresh_search(session, [row['id'] for row in rows])
+            await cls.commit(session)
+            count_cache.discard(cls.model,
+                                {key for row in rows for key in row})
+
+            query = (
+                select(cls.model)
+                .where(cls.model.id.in_([row['id'] for row in rows]))
+                .execution_options(populate_existing=True)
+            )
+
+            for option in options:
+                query = query.options(joinedload(getattr(cls.model, option)))
+
+            result = await session.execute(query)
+            loaded = {record.id: record
+                      for record in result.unique().scalars().all()}
+            return [loaded[row['id']] for row in rows if row['id'] in loaded]
+
+    @classmethod
+    async def delete_many(cls, ids):
+        if not ids:
+            return []
+
+        async with cls.session() as session:
+            # Bulk DELETE bypasses the unit of work, so detach children the
+            # way session.delete() would before removing the parents.
+            for relationship in inspect(cls.model).relationships:
+                if (relationship.direction is not ONETOMANY
+                        or relationship.cascade.delete):
+                    continue
+                for _, remote in relationship.local_remote_pairs:
+                    await session.execute(
+                        update(relationship.mapper.class_)
+                        .where(remote.in_(ids))
+                        .values({remote.key: None})
+                    )
+
+            query = (
+                delete(cls.model)
+                .where(cls.model.id.in_(ids))
+                .returning(cls.model)
+            )
+            result = await session.execute(query)
+            deleted_records = result.scalars().all()
+            await cls.refresh_search(
+                session, [record.id for record in deleted_records])
+            await cls.adjust_counters(session, deleted_records, -1)
+            await cls.commit(session)
+
+        for deleted_record in deleted_records:
+            count_cache.adjust(cls.model, deleted_record, -1)
+        return [record.id for record in deleted_records]
 
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+# Benchmark against a throwaway database unless one is given explicitly.
+os.environ.setdefault(
+    'DATABASE_URL',
+    f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/feed-benchmark.db'
+)
+
+from database import Base, engine  # noqa: E402
+from feed.models import FeedDAO  # noqa: E402
+from feed.timeline import timelines  # noqa: E402
+from posts.models import PostDAO  # noqa: E402
+from users.models import FollowDAO, UsersDAO  # noqa: E402
+
+
+async def seed(followees: int, posts_per_author: int) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    users = await UsersDAO.add_many([
+        {'email': f'user{index}@example.com', 'username': f'user{index}',
+         'password': '-'}
+        for index in range(followees * 2 + 1)
+    ])
+    reader, authors = users[0], users[1:]
+    for author in authors:
+        await PostDAO.add_many([
+            {'text': f'{author.username} #{index}', 'author_id': author.id}
+            for index in range(posts_per_author)
+        ])
+    # Half of the authors are followed, the rest only add noise.
+    await FollowDAO.add_many([
+        {'user_id': reader.id, 'following_id': author.id}
+        for author in authors[:followees]
+    ])
+    return reader.id
+
+
+async def walk(find_page, user_id: int, pages: int, limit: int):
+    cursor = None
+    for _ in range(pages):
+        page = await find_page(user_id, 'author', cursor=cursor, limit=limit)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+
+async def measure(find_page, user_id: int, args, before=None):
+    timings = []
+    for _ in range(args.repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        await walk(find_page, user_id, args.pages, args.limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(args):
+    user_id = await seed(args.followees, args.posts_per_author)
+    strategies = [
+        ('join', FeedDAO.find_page_by_join, None),
+        ('fanout', FeedDAO.find_page_by_fanout, None),
+        ('materialized (cold)', timelines.find_page,
+         lambda: timelines.invalidate(user_id)),
+        ('materialized (warm)', timelines.find_page, None),
+    ]
+
+    print(f'{args.followees} followees, {args.posts_per_author} posts each, '
+          f'{args.pages} pages of {args.limit}, {args.repeat} runs')
+    print(f'{"strategy":<22}{"median ms":>12}{"min ms":>12}{"max ms":>12}')
+    for name, find_page, before in strategies:
+        timings = await measure(find_page, user_id, args, before)
+        print(f'{name:<22}{statistics.median(timings):>12.2f}'
+              f'{min(timings):>12.2f}{max(timings):>12.2f}')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the home feed strategies.')
+    parser.add_argument('--followees', type=int, default=200)
+    parser.add_argument('--posts-per-author', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
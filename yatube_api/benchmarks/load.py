@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Benchmark against a throwaway database unless one is given explicitly.
+os.environ.setdefault(
+    'DATABASE_URL',
+    f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/load-benchmark.db'
+)
+# Every simulated client shares one address and a few users.
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+import httpx  # noqa: E402
+
+from database import Base, engine  # noqa: E402
+from instrumentation import count_queries  # noqa: E402
+from main import app  # noqa: E402
+from posts.models import CommentDAO, GroupDAO, PostDAO  # noqa: E402
+from users.auth import create_token, token_claims  # noqa: E402
+from users.hashing import password_hasher  # noqa: E402
+from users.models import FollowDAO, UsersDAO  # noqa: E402
+from users.tokens import start_family  # noqa: E402
+
+PASSWORD = 'benchmark-password'
+API = '/api/v1'
+# Rows inserted per add_many() call while seeding.
+SEED_BATCH_SIZE = 500
+WORDS = ('yatube', 'diary', 'travel', 'music', 'python', 'coffee', 'autumn',
+         'mountain', 'river', 'book', 'garden', 'city', 'evening', 'photo')
+
+
+async def add_in_batches(dao, rows):
+    added = []
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        added.extend(await dao.add_many(rows[start:start + SEED_BATCH_SIZE]))
+    return added
+
+
+async def seed(args, rng) -> SimpleNamespace:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    # One hash for everybody, hashing is what jwt:create measures.
+    password = await password_hasher.hash(PASSWORD)
+    users = await add_in_batches(UsersDAO, [
+        {'email': f'user{index}@example.com', 'username': f'user{index}',
+         'password': password}
+        for index in range(args.users)
+    ])
+    groups = await add_in_batches(GroupDAO, [
+        {'title': f'Group {index}', 'slug': f'group-{index}',
+         'description': f'Benchmark group {index}'}
+        for index in range(args.groups)
+    ])
+
+    started = datetime.now(timezone.utc) - timedelta(minutes=args.posts)
+    posts = await add_in_batches(PostDAO, [
+        {'text': f'Publication {index} ' + ' '.join(
+            rng.choices(WORDS, k=12)),
+         'author_id': rng.choice(users).id,
+         'group_id': rng.choice(groups).id if groups else None,
+         'pub_date': started + timedelta(minutes=index)}
+        for index in range(args.posts)
+    ])
+    await add_in_batches(CommentDAO, [
+        {'text': ' '.join(rng.choices(WORDS, k=8)),
+         'author_id': rng.choice(users).id,
+         'post_id': rng.choice(posts).id}
+        for _ in range(args.comments)
+    ])
+
+    pairs = set()
+    follows = min(args.follows, len(users) * (len(users) - 1))
+    while len(pairs) < follows:
+        follower, following = rng.sample(users, 2)
+        pairs.add((follower.id, following.id))
+    await add_in_batches(FollowDAO, [
+        {'user_id': follower, 'following_id': following}
+        for follower, following in sorted(pairs)
+    ])
+
+    posts_by_author = {}
+    for post in posts:
+        posts_by_author.setdefault(post.author_id, []).append(post.id)
+
+    return SimpleNamespace(
+        rng=rng,
+        users=users,
+        usernames=[user.username for user in users],
+        emails=[user.email for user in users],
+        post_ids=[post.id for post in posts],
+        # Only authors may comment their own publications.
+        own_post_ids=[posts_by_author.get(user.id, []) for user in users],
+        group_ids=[group.id for group in groups],
+        clients=[],
+        registered=itertools.count()
+    )
+
+
+async def log_in(client, data, count: int):
+    for email, username, post_ids in zip(data.emails[:count], data.usernames,
+                                         data.own_post_ids):
+        response = await client.post(f'{API}/jwt/create', json={
+            'email': email, 'password': PASSWORD})
+        response.raise_for_status()
+        tokens = response.json()
+        data.clients.append(SimpleNamespace(
+            headers={'Authorization': f'Bearer {tokens["access"]}'},
+            username=username,
+            post_ids=post_ids or data.post_ids
+        ))
+
+
+async def issue_refresh_tokens(data, count: int):
+    # Refresh tokens are single use, every request needs its own.
+    data.refresh_tokens = []
+    for index in range(count):
+        user = data.users[index % len(data.users)]
+        family = await start_family(user.id)
+        data.refresh_tokens.append(create_token(
+            data=token_claims(user) | family, token_type='refresh'))
+
+
+# Each scenario turns (data, request index) into a request.
+def posts_list(data, index):
+    return 'GET', f'{API}/posts', {'params': {
+        'limit': 20, 'offset': data.rng.randrange(len(data.post_ids))}}
+
+
+def posts_keyset(data, index):
+    return 'GET', f'{API}/posts', {'params': {'limit': 20, 'cursor': ''}}
+
+
+def posts_filtered(data, index):
+    return 'GET', f'{API}/posts', {'params': {
+        'limit': 20, 'group': data.rng.choice(data.group_ids),
+        'author': data.rng.choice(data.usernames)}}
+
+
+def posts_detail(data, index):
+    return 'GET', f'{API}/posts/{data.rng.choice(data.post_ids)}', {}
+
+
+def posts_create(data, index):
+    client = data.clients[index % len(data.clients)]
+    return 'POST', f'{API}/posts', {
+        'headers': client.headers,
+        'json': {'text': f'Load test publication {index}',
+                 'group': data.rng.choice(data.group_ids)}}
+
+
+def comments_list(data, index):
+    post_id = data.rng.choice(data.post_ids)
+    return 'GET', f'{API}/posts/{post_id}/comments', {}
+
+
+def comments_create(data, index):
+    client = data.clients[index % len(data.clients)]
+    post_id = data.rng.choice(client.post_ids)
+    return 'POST', f'{API}/posts/{post_id}/comments', {
+        'headers': client.headers,
+        'json': {'text': f'Load test comment {index}'}}
+
+
+def groups_list(data, index):
+    return 'GET', f'{API}/groups', {}
+
+
+def groups_detail(data, index):
+    return 'GET', f'{API}/groups/{data.rng.choice(data.group_ids)}', {}
+
+
+def follow_list(data, index):
+    client = data.clients[index % len(data.clients)]
+    return 'GET', f'{API}/follow', {'headers': client.headers}
+
+
+def follow_toggle(data, index):
+    # Even requests subscribe, odd ones undo the previous subscription.
+    client = data.clients[index // 2 % len(data.clients)]
+    following = data.usernames[-1 - (index // 2) % len(data.usernames)]
+    if index % 2 == 0:
+        return 'POST', f'{API}/follow', {
+            'headers': client.headers, 'json': {'following': following}}
+    return 'DELETE', f'{API}/follow/{following}', {'headers': client.headers}
+
+
+def follow_check(data, index):
+    client = data.clients[index % len(data.clients)]
+    return 'GET', f'{API}/follow/check', {
+        'headers': client.headers,
+        'params': {'username': data.rng.sample(data.usernames, 10)}}
+
+
+def followers_list(data, index):
+    username = data.rng.choice(data.usernames)
+    return 'GET', f'{API}/users/{username}/followers', {}
+
+
+def feed(data, index):
+    client = data.clients[index % len(data.clients)]
+    return 'GET', f'{API}/feed', {'headers': client.headers}
+
+
+def search(data, index):
+    return 'GET', f'{API}/search', {'params': {
+        'q': data.rng.choice(WORDS)}}
+
+
+def jwt_create(data, index):
+    email = data.emails[index % len(data.emails)]
+    return 'POST', f'{API}/jwt/create', {'json': {
+        'email': email, 'password': PASSWORD}}
+
+
+def jwt_refresh(data, index):
+    return 'POST', f'{API}/jwt/refresh', {'json': {
+        'refresh': data.refresh_tokens[index]}}
+
+
+def jwt_verify(data, index):
+    client = data.clients[index % len(data.clients)]
+    token = client.headers['Authorization'].removeprefix('Bearer ')
+    return 'POST', f'{API}/jwt/verify', {'json': {'token': token}}
+
+
+def register(data, index):
+    number = next(data.registered)
+    return 'POST', f'{API}/register', {'json': {
+        'email': f'new{number}@example.com', 'password': PASSWORD,
+        'name': f'new{number}'}}
+
+
+SCENARIOS = {
+    'posts:list': posts_list,
+    'posts:keyset': posts_keyset,
+    'posts:filtered': posts_filtered,
+    'posts:detail': posts_detail,
+    'posts:create': posts_create,
+    'comments:list': comments_list,
+    'comments:create': comments_create,
+    'groups:list': groups_list,
+    'groups:detail': groups_detail,
+    'follow:list': follow_list,
+    'follow:toggle': follow_toggle,
+    'follow:check': follow_check,
+    'follow:followers': followers_list,
+    'feed': feed,
+    'search': search,
+    'jwt:create': jwt_create,
+    'jwt:refresh': jwt_refresh,
+    'jwt:verify': jwt_verify,
+    'register': register,
+}
+
+
+def percentile(quantiles, value: int) -> float:
+    return quantiles[value - 1] * 1000 if quantiles else 0
+
+
+async def run_scenario(client, data, build, requests: int,
+                       concurrency: int) -> dict:
+    latencies, queries, statuses = [], [], []
+    indexes = iter(range(requests))
+
+    async def worker():
+        for index in indexes:
+            method, url, options = build(data, index)
+            with count_queries() as stats:
+                started = time.perf_counter()
+                response = await client.request(method, url, **options)
+                latencies.append(time.perf_counter() - started)
+            queries.append(stats.count)
+            statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = (statistics.quantiles(latencies, n=100, method='inclusive')
+                 if len(latencies) > 1 else [])
+    return {
+        'requests': len(latencies),
+        'errors': sum(status >= 500 for status in statuses),
+        'rejected': sum(400 <= status < 500 for status in statuses),
+        'throughput': len(latencies) / elapsed,
+        'mean': statistics.fmean(latencies) * 1000,
+        'p50': percentile(quantiles, 50),
+        'p95': percentile(quantiles, 95),
+        'p99': percentile(quantiles, 99),
+        'queries': statistics.fmean(queries)
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float,
+            query_threshold: float) -> list[str]:
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]:.2f} ms -> '
+                    f'{current[metric]:.2f} ms')
+        if current['throughput'] < previous['throughput'] * (1 - threshold):
+            regressions.append(
+                f'{name}: throughput {previous["throughput"]:.1f} -> '
+                f'{current["throughput"]:.1f} req/s')
+        if current['queries'] > previous['queries'] + query_threshold:
+            regressions.append(
+                f'{name}: queries per request {previous["queries"]:.2f} -> '
+                f'{current["queries"]:.2f}')
+    return regressions
+
+
+def print_results(results: dict):
+    print(f'{"scenario":<18}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"p99 ms":>9}{"queries":>9}{"4xx":>6}{"5xx":>6}')
+    for name, result in results['scenarios'].items():
+        print(f'{name:<18}{result["throughput"]:>9.1f}{result["p50"]:>9.2f}'
+              f'{result["p95"]:>9.2f}{result["p99"]:>9.2f}'
+              f'{result["queries"]:>9.2f}{result["rejected"]:>6}'
+              f'{result["errors"]:>6}')
+
+
+async def main(args) -> int:
+    names = args.scenario or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+    data = await seed(args, random.Random(args.seed))
+    transport = httpx.ASGITransport(app=app)
+    results = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'options': vars(args) | {'baseline': None, 'output': None}
+        },
+        'scenarios': {}
+    }
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url='http://benchmark') as client:
+        await log_in(client, data, min(args.concurrency, args.users))
+        await issue_refresh_tokens(data, args.requests)
+        for name in names:
+            results['scenarios'][name] = await run_scenario(
+                client, data, SCENARIOS[name], args.requests,
+                args.concurrency)
+    await engine.dispose()
+
+    print(f'{args.users} users, {args.groups} groups, {args.posts} posts, '
+          f'{args.comments} comments, {args.follows} follows; '
+          f'{args.requests} requests per scenario, '
+          f'{args.concurrency} concurrent clients')
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.threshold, args.query_threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=('Seed a synthetic dataset and measure every router '
+                     'with concurrent in-process clients.'))
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--follows', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--scenario', action='append',
+                        help=f'one of {", ".join(SCENARIOS)}; repeatable, '
+                             'all scenarios by default')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline',
+                        help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed relative latency/throughput regression')
+    parser.add_argument('--query-threshold', type=float, default=0.1,
+                        help='allowed increase in queries per request')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Benchmark against a throwaway database unless one is given explicitly.
+os.environ.setdefault(
+    'DATABASE_URL',
+    f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/search-benchmark.db'
+)
+
+from sqlalchemy import select  # noqa: E402
+
+from config import settings  # noqa: E402
+from database import Base, engine  # noqa: E402
+from posts.models import Post, PostDAO  # noqa: E402
+from users.models import UsersDAO  # noqa: E402
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pu')
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES)
+                          for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+async def seed(posts: int, words_per_post: int, vocabulary: list[str],
+               rng: random.Random):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    author = await UsersDAO.add(email='author@example.com',
+                                username='author', password='-')
+    # Zipf-like weights, so some words are common and most are rare.
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    batch = settings.BULK_MAX_ITEMS
+    for start in range(0, posts, batch):
+        await PostDAO.add_many([
+            {'text': ' '.join(rng.choices(vocabulary, weights,
+                                          k=words_per_post)),
+             'author_id': author.id}
+            for _ in range(min(batch, posts - start))
+        ])
+
+
+async def like_scan(term: str, limit: int):
+    async with PostDAO.session() as session:
+        result = await session.execute(
+            select(Post.id)
+            .where(Post.text.like(f'%{term}%'))
+            .order_by(Post.pub_date.desc(), Post.id.desc())
+            .limit(limit)
+        )
+        return result.all()
+
+
+async def full_text(term: str, limit: int):
+    return await PostDAO.search(term, limit=limit)
+
+
+async def measure(func, term: str, limit: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func(term, limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    started = time.perf_counter()
+    await seed(args.posts, args.words, vocabulary, rng)
+    print(f'seeded {args.posts} posts in '
+          f'{time.perf_counter() - started:.1f}s')
+
+    terms = {
+        'common': vocabulary[0],
+        'medium': vocabulary[len(vocabulary) // 20],
+        'rare': vocabulary[-1],
+        'missing': 'zzzz'
+    }
+    print(f'{"term":<18}{"LIKE ms":>12}{"FTS ms":>12}')
+    for kind, term in terms.items():
+        like = await measure(like_scan, term, args.limit, args.repeat)
+        fts = await measure(full_text, term, args.limit, args.repeat)
+        print(f'{kind + " " + term:<18}{like:>12.2f}{fts:>12.2f}')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare full-text search with a LIKE scan.')
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=30)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from types import SimpleNamespace
+
+from posts.router import POST_FIELDS, post_answer
+from posts.schemas import SPostsResponse
+from responses import FastJSONResponse, rows_answer
+
+response_adapter = TypeAdapter(SPostsResponse)
+
+
+def make_rows(count: int):
+    started = datetime(2025, 1, 1)
+    author = SimpleNamespace(username='author')
+    instances, rows = [], []
+    for index in range(count):
+        pub_date = started + timedelta(minutes=index)
+        text = f'Publication #{index} ' * 8
+        instances.append(SimpleNamespace(
+            id=index, author=author, text=text, pub_date=pub_date,
+            image=None, group_id=1, comment_count=0))
+        # Shaped like the rows POST_COLUMNS select, version included.
+        rows.append((index, 'author', text, pub_date, None, 1, 0, 1))
+    return instances, rows
+
+
+def envelope(results):
+    return {'count': len(results), 'count_mode': 'exact', 'next': None,
+            'previous': None, 'results': results}
+
+
+def models_path(instances) -> bytes:
+    # What FastAPI does with a dict of models and a response_model.
+    content = envelope([post_answer(post) for post in instances])
+    validated = response_adapter.validate_python(content)
+    return JSONResponse(
+        response_adapter.dump_python(validated, mode='json')).body
+
+
+def rows_path(rows) -> bytes:
+    return FastJSONResponse(envelope(rows_answer(POST_FIELDS, rows))).body
+
+
+def measure(func, data, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    instances, rows = make_rows(args.rows)
+    assert models_path(instances[:3]) == rows_path(rows[:3])
+
+    before = measure(models_path, instances, args.repeat)
+    after = measure(rows_path, rows, args.repeat)
+    print(f'{args.rows} rows, best of {args.repeat} runs')
+    print(f'{"path":<28}{"total ms":>12}{"per row us":>12}')
+    for name, elapsed in (('models + response_model', before),
+                          ('rows + orjson', after)):
+        print(f'{name:<28}{elapsed * 1000:>12.2f}'
+              f'{elapsed / args.rows * 1e6:>12.2f}')
+    print(f'speedup: {before / after:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare per-row serialization cost of list responses.')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import settings
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def values(self):
+        now = time.monotonic()
+        return [value for value, expires_at in self._data.values()
+                if expires_at >= now]
+
+    def items(self):
+        # Drops expired entries on the way.
+        now = time.monotonic()
+        items = []
+        for key, (value, expires_at) in list(self._data.items()):
+            if expires_at < now:
+                del self._data[key]
+            else:
+                items.append((key, value))
+        return items
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def discard_if(self, predicate):
+        for key, (value, _) in list(self._data.items()):
+            if predicate(value):
+                del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._namespaces = {}
+
+    def _cache(self, namespace: str, ttl: float) -> TTLCache:
+        cache = self._namespaces.get(namespace)
+        if cache is None:
+            cache = self._namespaces[namespace] = TTLCache(self.maxsize, ttl)
+        return cache
+
+    async def get(self, namespace: str, key: str):
+        cache = self._namespaces.get(namespace)
+        return cache.get(key) if cache is not None else None
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float):
+        self._cache(namespace, ttl).set(key, value, ttl)
+
+    async def clear(self, namespace: str):
+        cache = self._namespaces.get(namespace)
+        if cache is not None:
+            cache.clear()
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('The redis cache backend requires the "redis" '
+                               'package.')
+        # Eviction is left to the server's maxmemory-policy.
+        self._redis = redis.from_url(url)
+
+    async def get(self, namespace: str, key: str):
+        return await self._redis.get(f'{namespace}:{key}')
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float):
+        await self._redis.set(f'{namespace}:{key}', value,
+                              px=int(ttl * 1000))
+
+    async def clear(self, namespace: str):
+        keys = [key async for key in self._redis.scan_iter(f'{namespace}:*')]
+        if keys:
+            await self._redis.delete(*keys)
+
+
+def create_backend():
+    if settings.CACHE_BACKEND == 'redis':
+        return RedisBackend(settings.CACHE_REDIS_URL)
+    return MemoryBackend(settings.CACHE_MAXSIZE)
+
+
+cache_backend = create_backend()
+# Response caches to invalidate when a table is written to.
+caches_by_table = {}
+pending_invalidations = set()
+
+
+class ResponseCache:
+    def __init__(self, namespace: str, ttl: float, tables=(),
+                 backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend or cache_backend
+        for table in tables:
+            caches_by_table.setdefault(table, []).append(self)
+
+    async def get(self, key: str):
+        return await self.backend.get(self.namespace, key)
+
+    async def set(self, key: str, value: bytes):
+        await self.backend.set(self.namespace, key, value, self.ttl)
+
+    async def invalidate(self):
+        await self.backend.clear(self.namespace)
+
+
+def _mark_written(session, table: str):
+    if table in caches_by_table:
+        session.info.setdefault('written_tables', set()).add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_statement_writes(orm_execute_state):
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and not orm_execute_state.is_select:
+        _mark_written(orm_execute_state.session, table.name)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_flush_writes(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        _mark_written(session, instance.__table__.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_written_tables(session):
+    tables = session.info.pop('written_tables', ())
+    caches = {cache for table in tables for cache in caches_by_table[table]}
+    if not caches:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    for cache in caches:
+        task = loop.create_task(cache.invalidate())
+        pending_invalidations.add(task)
+        task.add_done_callback(pending_invalidations.discard)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_written_tables(session):
+    session.info.pop('written_tables', None)
@@ -1,25 +1,40 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi import (APIRouter, HTTPException, Depends, Body, Query, Request,
+                     Response)
+from fastapi.responses import StreamingResponse
 
-from comments.schemas import SCommentResponse
+from comments.schemas import (SCommentRequest, SCommentResponse,
+                              SCommentsResponse, SCommentBulkUpdate,
+                              SCommentBulkResult)
+from config import settings
+from http_cache import conditional_response, make_etag
+from instrumentation import query_budget
 from posts.models import PostDAO, CommentDAO
 from posts.router import get_post_or_404
-from users.auth import validate_access_token
-from users.models import UsersDAO
+from ratelimit import check_user_limit, limit_by_user
+from responses import FastJSONResponse, rows_answer
+from users.auth import get_principal, validate_access_token
+from users.schemas import SPrincipal
 
 router = APIRouter(
     prefix='/api/v1/posts',
     tags=['Comments']
 )
 
+COMMENT_FIELDS = ('id', 'author', 'text', 'created', 'post')
+# SCommentResponse fields in order, then the row version for ETags.
+COMMENT_PROJECTION = CommentDAO.projection(
+    'id', ('author', 'author.username'), 'text', 'created',
+    ('post', 'post_id'), 'version'
+)
 
-async def get_comment_or_404(post_id: int, id: int, current_user: dict):
-    comment = await CommentDAO.find_one_or_none('author',
-                                                post_id=post_id, id=id)
+
+async def get_comment_or_404(post_id: int, id: int,
+                             principal: SPrincipal):
+    comment = await CommentDAO.find_one_or_none(post_id=post_id, id=id)
     if not comment:
         raise HTTPException(status_code=404, detail='Comment not found.')
 
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    if comment.author_id != user.id:
+    if comment.author_id != principal.uid:
         raise HTTPException(
             status_code=403,
             detail='You do not have permission to edit this comment.'
@@ -27,10 +42,10 @@ async def get_comment_or_404(post_id: int, id: int, current_user: dict):
     return comment
 
 
-def comment_answer(comment_data):
+def comment_answer(comment_data, author: str | None = None):
     answer = SCommentResponse(
         id=comment_data.id,
-        author=comment_data.author.username,
+        author=author or comment_data.author.username,
         text=comment_data.text,
         created=comment_data.created,
         post=comment_data.post_id
@@ -38,19 +53,101 @@ def comment_answer(comment_data):
     return answer
 
 
+async def stream_comments(post_id: int):
+    async for comment in CommentDAO.stream_all('author', post_id=post_id):
+        yield comment_answer(comment_data=comment).model_dump_json() + '\n'
+
+
 @router.get(
     '/{post_id}/comments',
-    response_model=list[SCommentResponse],
+    response_model=list[SCommentResponse] | SCommentsResponse,
     summary='Get Comments',
-    description='Retrieve all comments for a publication.'
+    description=(
+        'Retrieve all comments for a publication. Passing `limit` or '
+        '`cursor` returns a page of comments ordered by creation time with '
+        '`next`/`previous` links. `stream=true` streams every comment as '
+        'newline-delimited JSON.'
+    )
 )
-async def read_comments(post_id: int):
+@query_budget(3)
+async def read_comments(
+        post_id: int,
+        request: Request,
+        response: Response,
+        limit: int | None = Query(
+            default=None,
+            ge=settings.PAGINATION_DEFAULT_LIMIT_MIN,
+            le=settings.PAGINATION_DEFAULT_LIMIT_MAX
+        ),
+        cursor: str | None = Query(default=None),
+        stream: bool = Query(default=False)
+):
     post = await PostDAO.find_one_or_none(id=post_id)
     if not post:
         raise HTTPException(status_code=404, detail='Post not found.')
 
-    comments = await CommentDAO.find_all('author', post_id=post_id)
-    return [comment_answer(comment_data=comment) for comment in comments]
+    if stream:
+        return StreamingResponse(stream_comments(post_id),
+                                 media_type='application/x-ndjson')
+
+    fast = settings.FAST_SERIALIZATION
+
+    if limit is None and cursor is None:
+        comments = await CommentDAO.find_all(post_id=post_id,
+                                             **COMMENT_PROJECTION)
+        etag = make_etag('comments', post_id, [
+            (comment.id, comment.version) for comment in comments])
+        not_modified = conditional_response(request, response, etag=etag)
+        if not_modified:
+            return not_modified
+        if fast:
+            return FastJSONResponse(rows_answer(COMMENT_FIELDS, comments),
+                                    headers=dict(response.headers))
+        return [SCommentResponse.model_validate(comment._mapping)
+                for comment in comments]
+
+    limit = limit or settings.PAGINATION_DEFAULT_LIMIT
+    try:
+        page = await CommentDAO.find_all_with_keyset(
+            cursor=cursor, limit=limit, post_id=post_id,
+            **COMMENT_PROJECTION)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+
+    next_url = (
+        str(request.url.include_query_params(cursor=page.next_cursor,
+                                             limit=limit))
+        if page.next_cursor
+        else None
+    )
+    previous_url = (
+        str(request.url.include_query_params(cursor=page.previous_cursor,
+                                             limit=limit))
+        if page.previous_cursor
+        else None
+    )
+    total_count, count_mode = await CommentDAO.get_count(post_id=post_id)
+
+    etag = make_etag('comments', post_id, [
+        (comment.id, comment.version) for comment in page.items
+    ], total_count, next_url, previous_url, weak=True)
+    not_modified = conditional_response(request, response, etag=etag)
+    if not_modified:
+        return not_modified
+
+    answer = {
+        'count': total_count,
+        'count_mode': count_mode,
+        'next': next_url,
+        'previous': previous_url
+    }
+    if fast:
+        answer['results'] = rows_answer(COMMENT_FIELDS, page.items)
+        return FastJSONResponse(answer, headers=dict(response.headers))
+
+    answer['results'] = [SCommentResponse.model_validate(comment._mapping)
+                         for comment in page.items]
+    return answer
 
 
 @router.post(
@@ -58,23 +155,136 @@ async def read_comments(post_id: int):
     response_model=SCommentResponse,
     summary='Add Comment',
     description=('Add a new comment to a publication. Anonymous requests are '
-                 'not allowed')
+                 'not allowed'),
+    dependencies=[Depends(validate_access_token),
+                  Depends(limit_by_user('comment'))]
 )
 async def create_comment(post_id: int, text: str = Body(..., embed=True),
-                         current_user: dict = Depends(validate_access_token)):
-    await get_post_or_404(post_id, current_user)
-
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    if not user:
-        raise HTTPException(status_code=404, detail='User error.')
+                         principal: SPrincipal = Depends(get_principal)):
+    await get_post_or_404(post_id, principal)
 
     new_comment = await CommentDAO.add(
-        'author',
         text=text,
-        author_id=user.id,
+        author_id=principal.uid,
         post_id=post_id
     )
-    return comment_answer(comment_data=new_comment)
+    return comment_answer(comment_data=new_comment, author=principal.username)
+
+
+@router.post(
+    '/{post_id}/comments/bulk',
+    response_model=list[SCommentBulkResult],
+    summary='Add Comments',
+    description=('Add several comments to a publication in one request. '
+                 'Anonymous requests are not allowed.'),
+    dependencies=[Depends(validate_access_token)]
+)
+async def create_comments_bulk(
+    post_id: int,
+    comments_data: list[SCommentRequest] = Body(
+        ..., max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    # Every comment counts against the limit, not the request.
+    await check_user_limit('comment_bulk', principal,
+                           cost=max(len(comments_data), 1))
+    await get_post_or_404(post_id, principal)
+
+    new_comments = await CommentDAO.add_many(
+        [
+            {'text': comment_data.text, 'author_id': principal.uid,
+             'post_id': post_id}
+            for comment_data in comments_data
+        ]
+    )
+    return [
+        SCommentBulkResult(index=index, status=200, id=comment.id,
+                           result=comment_answer(comment_data=comment,
+                                                 author=principal.username))
+        for index, comment in enumerate(new_comments)
+    ]
+
+
+async def check_comments_bulk(post_id: int, ids, principal: SPrincipal):
+    comments = await CommentDAO.find_all_by_ids(set(ids))
+    authors = {comment.id: comment.author_id for comment in comments
+               if comment.post_id == post_id}
+
+    results, allowed = {}, []
+    for index, comment_id in enumerate(ids):
+        if comment_id not in authors:
+            results[index] = SCommentBulkResult(
+                index=index, status=404, id=comment_id,
+                detail='Comment not found.')
+        elif authors[comment_id] != principal.uid:
+            results[index] = SCommentBulkResult(
+                index=index, status=403, id=comment_id,
+                detail='You do not have permission to edit this comment.')
+        else:
+            allowed.append(index)
+    return results, allowed
+
+
+@router.put(
+    '/{post_id}/comments/bulk',
+    response_model=list[SCommentBulkResult],
+    summary='Update Comments',
+    description=(
+        'Update several comments for a publication by their IDs. Only the '
+        'author of a comment can update it. Anonymous requests are not '
+        'allowed.'
+    ),
+    dependencies=[Depends(validate_access_token)]
+)
+async def update_comments_bulk(
+    post_id: int,
+    comments_data: list[SCommentBulkUpdate] = Body(
+        ..., max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    results, allowed = await check_comments_bulk(
+        post_id, [comment_data.id for comment_data in comments_data],
+        principal)
+
+    updated_comments = await CommentDAO.update_many(
+        [
+            {'id': comments_data[index].id, 'text': comments_data[index].text}
+            for index in allowed
+        ]
+    )
+    updated_comments = {comment.id: comment for comment in updated_comments}
+    for index in allowed:
+        comment = updated_comments[comments_data[index].id]
+        results[index] = SCommentBulkResult(
+            index=index, status=200, id=comment.id,
+            result=comment_answer(comment_data=comment,
+                                  author=principal.username))
+    return [results[index] for index in sorted(results)]
+
+
+@router.post(
+    '/{post_id}/comments/bulk/delete',
+    response_model=list[SCommentBulkResult],
+    summary='Delete Comments',
+    description=(
+        'Delete several comments for a publication by their IDs. Only the '
+        'author of a comment can delete it. Anonymous requests are not '
+        'allowed.'
+    ),
+    dependencies=[Depends(validate_access_token)]
+)
+async def delete_comments_bulk(
+    post_id: int,
+    ids: list[int] = Body(..., embed=True, max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    results, allowed = await check_comments_bulk(post_id, ids, principal)
+
+    await CommentDAO.delete_many([ids[index] for index in allowed])
+    for index in allowed:
+        results[index] = SCommentBulkResult(index=index, status=200,
+                                            id=ids[index])
+    return [results[index] for index in sorted(results)]
 
 
 @router.get(
@@ -83,6 +293,7 @@ async def create_comment(post_id: int, text: str = Body(..., embed=True),
     summary='Get Comment',
     description='Retrieve a comment for a publication by its ID.'
 )
+@query_budget(1)
 async def read_comment_by_id(post_id: int, id: int):
     comment = await CommentDAO.find_one_or_none('author',
                                                 post_id=post_id, id=id)
@@ -98,17 +309,20 @@ async def read_comment_by_id(post_id: int, id: int):
     description=(
         'Update a comment for a publication by its ID. Only the author of the '
         'comment can update it. Anonymous requests are not allowed.'
-    )
+    ),
+    dependencies=[Depends(validate_access_token)]
 )
 async def update_comment(
     post_id: int,
     id: int,
     text: str = Body(..., embed=True),
-    current_user: dict = Depends(validate_access_token)
+    principal: SPrincipal = Depends(get_principal)
 ):
-    await get_comment_or_404(post_id=post_id, id=id, current_user=current_user)
-    updated_comment = await CommentDAO.update(id, 'author', text=text)
-    return comment_answer(comment_data=updated_comment)
+    await get_comment_or_404(post_id=post_id, id=id,
+                             principal=principal)
+    updated_comment = await CommentDAO.update(id, text=text)
+    return comment_answer(comment_data=updated_comment,
+                          author=principal.username)
 
 
 @router.delete(
@@ -117,10 +331,12 @@ async def update_comment(
     description=(
         'Delete a comment for a publication by its ID. Only the author of the '
         'comment can delete it. Anonymous requests are not allowed.'
-    )
+    ),
+    dependencies=[Depends(validate_access_token)]
 )
 async def delete_comment(post_id: int, id: int,
-                         current_user: dict = Depends(validate_access_token)):
-    await get_comment_or_404(post_id=post_id, id=id, current_user=current_user)
+                         principal: SPrincipal = Depends(get_principal)):
+    await get_comment_or_404(post_id=post_id, id=id,
+                             principal=principal)
     await CommentDAO.delete(model_id=id)
 
@@ -1,5 +1,16 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Literal
+
+from posts.schemas import SBulkResult
+
+
+class SCommentRequest(BaseModel):
+    text: str
+
+
+class SCommentBulkUpdate(SCommentRequest):
+    id: int
 
 
 class SCommentResponse(BaseModel):
@@ -11,3 +22,15 @@ class SCommentResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class SCommentsResponse(BaseModel):
+    count: int
+    count_mode: Literal['exact', 'cached', 'estimated'] = 'exact'
+    next: str | None = None
+    previous: str | None = None
+    results: list[SCommentResponse]
+
+
+class SCommentBulkResult(SBulkResult):
+    result: SCommentResponse | None = None
@@ -0,0 +1,18 @@
+import operator
+
+OPERATORS = {
+    'eq': operator.eq,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge
+}
+
+
+def matches(row, conditions) -> bool:
+    try:
+        return all(OPERATORS[op](getattr(row, column), value)
+                   for column, op, value in conditions)
+    except TypeError:
+        # NULL columns never satisfy a range condition.
+        return False
@@ -1,14 +1,83 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
+    # SECRET_KEY signs new tokens under JWT_KEY_ID. Retired keys stay in
+    # JWT_PREVIOUS_KEYS ({"kid": "secret"}) until their tokens expire.
+    JWT_KEY_ID: str = '1'
+    JWT_PREVIOUS_KEYS: dict[str, str] = {}
+    TOKEN_CACHE_MAXSIZE: int = 10000
+    TOKEN_STORE: Literal['memory', 'database', 'redis'] = 'database'
+    TOKEN_STORE_REDIS_URL: str = 'redis://localhost:6379/0'
+    TOKEN_REVOCATION_SYNC_INTERVAL: float = 5
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal['memory', 'redis'] = 'memory'
+    RATE_LIMIT_REDIS_URL: str = 'redis://localhost:6379/0'
+    RATE_LIMIT_MAXSIZE: int = 100000
+    # Bucket name -> (burst, seconds to refill the whole burst).
+    RATE_LIMITS: dict[str, tuple[int, float]] = {
+        'login': (10, 60),
+        'register': (5, 60),
+        'refresh': (30, 60),
+        'post': (30, 60),
+        'comment': (60, 60),
+        # Bulk buckets count items, a burst should fit several full batches.
+        'post_bulk': (5000, 60),
+        'comment_bulk': (5000, 60)
+    }
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_QUEUE_TIMEOUT: float = 5
+    ADMISSION_RETRY_AFTER: int = 1
+    DATABASE_URL: str = 'sqlite+aiosqlite:///db.db'
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_ECHO: bool = False
+    DB_ECHO_SAMPLE_RATE: float = 1.0
+    QUERY_STATS: bool = True
+    QUERY_CHECKS: Literal['off', 'warn', 'raise'] = 'off'
+    QUERY_REPEAT_THRESHOLD: int = 3
+    SQLITE_JOURNAL_MODE: Literal['WAL', 'DELETE', 'TRUNCATE'] = 'WAL'
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_SYNCHRONOUS: Literal['OFF', 'NORMAL', 'FULL'] = 'NORMAL'
+    SQLITE_MMAP_SIZE: int = 268435456
+    SQLITE_CACHE_SIZE: int = -65536
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 120
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     PAGINATION_DEFAULT_LIMIT: int = 10
     PAGINATION_DEFAULT_LIMIT_MIN: int = 1
     PAGINATION_DEFAULT_LIMIT_MAX: int = 100
+    FOLLOW_CHECK_MAX_USERNAMES: int = 100
+    BULK_MAX_ITEMS: int = 500
+    STREAM_BATCH_SIZE: int = 500
+    COUNT_DEFAULT_MODE: Literal['exact', 'cached', 'estimated'] = 'cached'
+    COUNT_CACHE_TTL: float = 30
+    # Expired counts are kept this long to serve estimates.
+    COUNT_CACHE_STALE_TTL: float = 300
+    COUNT_CACHE_MAXSIZE: int = 1024
+    COUNTER_RECONCILE_BATCH_SIZE: int = 1000
+    USER_CACHE_MAXSIZE: int = 1024
+    USER_CACHE_TTL: float = 60
+    PASSWORD_HASH_ROUNDS: int = 12
+    PASSWORD_HASH_EXECUTOR: Literal['thread', 'process'] = 'thread'
+    PASSWORD_HASH_WORKERS: int = 4
+    HTTP_CACHE_MAX_AGE: int = 30
+    FAST_SERIALIZATION: bool = False
+    CACHE_BACKEND: Literal['memory', 'redis'] = 'memory'
+    CACHE_REDIS_URL: str = 'redis://localhost:6379/0'
+    CACHE_MAXSIZE: int = 1024
+    GROUP_CACHE_TTL: float = 300
+    SEARCH_SNIPPET_WORDS: int = 12
+    FEED_STRATEGY: Literal['join', 'fanout', 'materialized'] = 'join'
+    FEED_TIMELINE_SIZE: int = 800
+    FEED_TIMELINE_USERS: int = 10000
+    FEED_TIMELINE_TTL: float = 300
 
     class Config:
         env_file = '.env'
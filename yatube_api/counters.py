@@ -0,0 +1,69 @@
+import time
+
+from cache import TTLCache
+from conditions import matches
+from config import settings
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATED = 'estimated'
+
+
+# Writes made by other processes are only picked up once an entry expires,
+# so the TTL bounds how stale a cached count can get.
+class CountCache:
+    def __init__(self, maxsize: int = settings.COUNT_CACHE_MAXSIZE,
+                 stale_ttl: float = settings.COUNT_CACHE_STALE_TTL):
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        # Table name -> TTLCache, so writes only walk their own table.
+        self._tables = {}
+
+    @staticmethod
+    def _key(conditions):
+        # Conditions are (column, operator, value) triples.
+        return tuple(sorted(conditions, key=lambda condition: condition[:2]))
+
+    @staticmethod
+    def cacheable(conditions) -> bool:
+        # Range bounds are open-ended client input, every value would get
+        # an entry of its own.
+        return all(op == 'eq' for _, op, _ in conditions)
+
+    def _counts(self, model) -> TTLCache:
+        counts = self._tables.get(model.__tablename__)
+        if counts is None:
+            counts = self._tables[model.__tablename__] = TTLCache(
+                maxsize=self.maxsize, ttl=self.stale_ttl)
+        return counts
+
+    def get(self, model, conditions, fresh: bool = True):
+        entry = self._counts(model).get(self._key(conditions))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if fresh and expires_at < time.monotonic():
+            return None
+        return value
+
+    def set(self, model, conditions, value: int, ttl: float):
+        if not self.cacheable(conditions):
+            return
+        self._counts(model).set(
+            self._key(conditions), [value, time.monotonic() + ttl],
+            ttl=max(ttl, self.stale_ttl))
+
+    def adjust(self, model, row, delta: int):
+        for conditions, entry in self._counts(model).items():
+            if matches(row, conditions):
+                entry[0] = max(entry[0] + delta, 0)
+
+    def discard(self, model, columns):
+        columns = set(columns)
+        counts = self._counts(model)
+        for conditions, _ in counts.items():
+            if columns.intersection(column for column, _, _ in conditions):
+                counts.pop(conditions)
+
+
+count_cache = CountCache()
@@ -1,11 +1,107 @@
+import logging
+import random
+from contextvars import ContextVar
+from sqlalchemy import DateTime, event, inspect
+from sqlalchemy.dialects.sqlite import DATETIME
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-DATABASE_URL = 'sqlite+aiosqlite:///db.db'
+from config import settings
+from instrumentation import instrument_engine
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+DATABASE_URL = settings.DATABASE_URL
+
+sql_logger = logging.getLogger('yatube.sql')
+
+
+def create_engine():
+    url = make_url(DATABASE_URL)
+    options = {
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'query_cache_size': settings.DB_STATEMENT_CACHE_SIZE
+    }
+    if url.database not in (None, '', ':memory:'):
+        options.update(poolclass=AsyncAdaptedQueuePool,
+                       pool_size=settings.DB_POOL_SIZE,
+                       max_overflow=settings.DB_MAX_OVERFLOW)
+    if url.get_driver_name() == 'asyncpg':
+        url = url.update_query_dict({
+            'prepared_statement_cache_size':
+                str(settings.DB_STATEMENT_CACHE_SIZE)
+        })
+
+    new_engine = create_async_engine(url, **options)
+
+    if url.get_backend_name() == 'sqlite':
+        event.listen(new_engine.sync_engine, 'connect', set_sqlite_pragmas)
+    if settings.QUERY_STATS:
+        instrument_engine(new_engine)
+    if settings.DB_ECHO:
+        event.listen(new_engine.sync_engine, 'before_cursor_execute',
+                     log_statement)
+    return new_engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}')
+    cursor.execute(f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}')
+    cursor.execute(f'PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}')
+    cursor.close()
+
+
+def log_statement(connection, cursor, statement, parameters, context,
+                  executemany):
+    if random.random() < settings.DB_ECHO_SAMPLE_RATE:
+        sql_logger.info('%s %r', statement, parameters)
+
+
+engine = create_engine()
 async_session_maker = sessionmaker(engine, class_=AsyncSession,
                                    expire_on_commit=False)
 
 Base = declarative_base()
 
+current_session: ContextVar[AsyncSession | None] = ContextVar(
+    'current_session', default=None)
+
+
+async def request_session():
+    async with async_session_maker() as session:
+        token = current_session.set(session)
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            current_session.reset(token)
+
+# SQLite keeps datetimes as text: store them in the same format as
+# CURRENT_TIMESTAMP so keyset comparisons against bound values are exact.
+Timestamp = DateTime(timezone=True).with_variant(
+    DATETIME(truncate_microseconds=True), 'sqlite')
+
+
+async def find_missing_indexes() -> list[str]:
+    def compare(connection):
+        inspector = inspect(connection)
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                missing.extend(index.name for index in table.indexes)
+                continue
+            existing = {index['name']
+                        for index in inspector.get_indexes(table.name)}
+            missing.extend(index.name for index in table.indexes
+                           if index.name not in existing)
+        return missing
+
+    async with engine.connect() as connection:
+        return await connection.run_sync(compare)
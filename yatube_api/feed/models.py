@@ -0,0 +1,66 @@
+from sqlalchemy import select
+
+from config import settings
+from pagination import NEXT, PREVIOUS, decode_cursor, make_page
+from posts.models import Post, PostDAO
+from users.models import Follow, FollowDAO
+
+
+class FeedDAO(PostDAO):
+    @staticmethod
+    def following_ids(user_id: int):
+        return select(Follow.following_id).where(Follow.user_id == user_id)
+
+    @classmethod
+    async def find_page_by_join(
+        cls,
+        user_id: int,
+        *options,
+        cursor: str | None = None,
+        limit: int = settings.PAGINATION_DEFAULT_LIMIT
+    ):
+        return await cls.find_all_with_keyset(
+            *options,
+            cursor=cursor,
+            limit=limit,
+            where=(Post.author_id.in_(cls.following_ids(user_id)),)
+        )
+
+    @classmethod
+    async def find_page_by_fanout(
+        cls,
+        user_id: int,
+        *options,
+        cursor: str | None = None,
+        limit: int = settings.PAGINATION_DEFAULT_LIMIT
+    ):
+        direction = NEXT
+        if cursor:
+            direction, _ = decode_cursor(cursor, cls.keyset_types())
+        backwards = direction == PREVIOUS
+
+        items, has_more = [], False
+        for author_id in await FollowDAO.find_following_ids(user_id):
+            page = await cls.find_all_with_keyset(
+                *options, cursor=cursor, limit=limit, author_id=author_id)
+            items.extend(page.items)
+            # A backwards page only links further back when it was cut off.
+            more = page.previous_cursor if backwards else page.next_cursor
+            has_more = has_more or more is not None
+
+        items.sort(key=lambda post: (post.pub_date, post.id), reverse=True)
+        has_more = has_more or len(items) > limit
+        items = items[-limit:] if backwards else items[:limit]
+        return make_page(items, cls.keyset, direction, bool(cursor),
+                         has_more)
+
+    @classmethod
+    async def find_timeline_keys(cls, user_id: int, limit: int):
+        async with cls.session() as session:
+            result = await session.execute(
+                select(Post.pub_date, Post.id)
+                .where(Post.author_id.in_(cls.following_ids(user_id)))
+                .order_by(Post.pub_date.desc(), Post.id.desc())
+                .limit(limit)
+            )
+            return [tuple(row) for row in result.all()]
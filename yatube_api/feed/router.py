@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+
+from config import settings
+from feed.models import FeedDAO
+from feed.schemas import SFeedResponse
+from feed.timeline import timelines
+from instrumentation import query_budget
+from posts.router import post_answer
+from users.auth import get_principal
+from users.schemas import SPrincipal
+
+router = APIRouter(
+    prefix='/api/v1/feed',
+    tags=['Feed']
+)
+
+STRATEGIES = {
+    'join': FeedDAO.find_page_by_join,
+    'fanout': FeedDAO.find_page_by_fanout,
+    'materialized': timelines.find_page
+}
+
+
+def feed_query_budget():
+    # Fanout runs a query per followed author by design.
+    if settings.FEED_STRATEGY == 'fanout':
+        return None
+    return 3
+
+
+@router.get(
+    '',
+    response_model=SFeedResponse,
+    summary='Get Feed',
+    description=(
+        'Retrieve publications of the authors followed by the user who made '
+        'the request, ordered from newest to oldest and paginated with the '
+        '`cursor` links. Anonymous requests are not allowed.'
+    )
+)
+@query_budget(feed_query_budget)
+async def read_feed(
+        request: Request,
+        limit: int = Query(
+            default=settings.PAGINATION_DEFAULT_LIMIT,
+            ge=settings.PAGINATION_DEFAULT_LIMIT_MIN,
+            le=settings.PAGINATION_DEFAULT_LIMIT_MAX
+        ),
+        cursor: str | None = Query(default=None),
+        principal: SPrincipal = Depends(get_principal)
+):
+    find_page = STRATEGIES[settings.FEED_STRATEGY]
+
+    try:
+        page = await find_page(principal.uid, 'author', cursor=cursor,
+                               limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+
+    return {
+        'next': (
+            str(request.url.include_query_params(cursor=page.next_cursor,
+                                                 limit=limit))
+            if page.next_cursor
+            else None
+        ),
+        'previous': (
+            str(request.url.include_query_params(
+                cursor=page.previous_cursor, limit=limit))
+            if page.previous_cursor
+            else None
+        ),
+        'results': [post_answer(post) for post in page.items]
+    }
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Optional
+
+from posts.schemas import SPostResponse
+
+
+class SFeedResponse(BaseModel):
+    next: Optional[str] = None
+    previous: Optional[str] = None
+    results: list[SPostResponse]
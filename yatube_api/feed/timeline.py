@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+
+from cache import TTLCache
+from config import settings
+from feed.models import FeedDAO
+from pagination import NEXT, decode_cursor, make_page
+from users.models import FollowDAO
+
+
+@dataclass
+class Timeline:
+    # (pub_date, id) keys from newest to oldest.
+    keys: list
+    # False once older keys were cut off at the size limit.
+    complete: bool
+
+
+# Each process keeps its own timelines, so writes made elsewhere only show
+# up once an entry expires.
+class TimelineCache:
+    def __init__(self, size: int, maxsize: int, ttl: float):
+        self.size = size
+        self._timelines = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, user_id: int) -> Timeline:
+        timeline = self._timelines.get(user_id)
+        if timeline is None:
+            keys = await FeedDAO.find_timeline_keys(user_id, self.size)
+            timeline = Timeline(keys=keys, complete=len(keys) < self.size)
+            self._timelines.set(user_id, timeline)
+        return timeline
+
+    async def push(self, posts):
+        if not posts or not len(self._timelines):
+            return
+
+        by_author = {}
+        for post in posts:
+            by_author.setdefault(post.author_id, []).append(
+                (post.pub_date, post.id))
+
+        pairs = await FollowDAO.find_follower_pairs(by_author)
+        for user_id, author_id in pairs:
+            timeline = self._timelines.get(user_id)
+            if timeline is None:
+                continue
+            timeline.keys.extend(by_author[author_id])
+            timeline.keys.sort(reverse=True)
+            if len(timeline.keys) > self.size:
+                del timeline.keys[self.size:]
+                timeline.complete = False
+
+    def discard(self, post_ids):
+        post_ids = set(post_ids)
+        if not post_ids:
+            return
+        for timeline in self._timelines.values():
+            timeline.keys[:] = [key for key in timeline.keys
+                                if key[1] not in post_ids]
+
+    def invalidate(self, user_id: int):
+        self._timelines.pop(user_id)
+
+    async def find_page(
+        self,
+        user_id: int,
+        *options,
+        cursor: str | None = None,
+        limit: int = settings.PAGINATION_DEFAULT_LIMIT
+    ):
+        direction, values = NEXT, None
+        if cursor:
+            direction, values = decode_cursor(cursor,
+                                              FeedDAO.keyset_types())
+
+        timeline = await self.get(user_id)
+        bound = tuple(values) if values is not None else None
+        try:
+            if bound is None:
+                keys = timeline.keys
+            elif direction == NEXT:
+                keys = [key for key in timeline.keys if key < bound]
+            else:
+                keys = [key for key in timeline.keys if key > bound]
+        except TypeError:
+            # A naive and an aware timestamp cannot be compared.
+            raise ValueError('Invalid cursor.')
+
+        has_more = len(keys) > limit
+        # Pages running past the cached window are served by the join.
+        if not timeline.complete and (
+                (direction == NEXT and not has_more)
+                or (direction != NEXT and (not timeline.keys
+                                           or bound < timeline.keys[-1]))):
+            return await FeedDAO.find_page_by_join(
+                user_id, *options, cursor=cursor, limit=limit)
+
+        keys = keys[:limit] if direction == NEXT else keys[-limit:]
+
+        posts = {post.id: post for post in await FeedDAO.find_all_by_ids(
+            [key[1] for key in keys], *options)}
+        items = [posts[post_id] for _, post_id in keys if post_id in posts]
+        return make_page(items, FeedDAO.keyset, direction, bound is not None,
+                         has_more)
+
+
+timelines = TimelineCache(size=settings.FEED_TIMELINE_SIZE,
+                          maxsize=settings.FEED_TIMELINE_USERS,
+                          ttl=settings.FEED_TIMELINE_TTL)
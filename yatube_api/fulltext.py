@@ -0,0 +1,137 @@
+import html
+import re
+from sqlalchemy import (DDL, bindparam, column, event, func, literal_column,
+                        select, table, text)
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import engine
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+# The database marks matches with control characters, so the text can be
+# escaped before the markup is added.
+MATCH_START = '\x02'
+MATCH_STOP = '\x03'
+# Postgres text search configuration, 'simple' does no stemming.
+TS_CONFIG = 'simple'
+SEARCH_TABLE = re.compile(r'_fts(_(data|idx|content|docsize|config))?$')
+
+
+def is_search_table(name: str) -> bool:
+    return SEARCH_TABLE.search(name) is not None
+
+
+def match_terms(query: str) -> list[str]:
+    return re.findall(r'\w+', query)
+
+
+def highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(MATCH_START, HIGHLIGHT_START)
+        .replace(MATCH_STOP, HIGHLIGHT_STOP)
+    )
+
+
+class SearchIndex:
+    def __init__(self, model, column_name: str = 'text'):
+        self.model = model
+        self.column = getattr(model, column_name)
+        self.name = f'{model.__tablename__}_fts'
+        self.dialect = engine.dialect.name
+
+        table_name = model.__tablename__
+        event.listen(model.__table__, 'after_create', DDL(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} '
+            f'USING fts5({column_name})'
+        ).execute_if(dialect='sqlite'))
+        event.listen(model.__table__, 'after_create', DDL(
+            f'CREATE INDEX IF NOT EXISTS ix_{self.name} ON {table_name} '
+            f"USING gin (to_tsvector('{TS_CONFIG}', {column_name}))"
+        ).execute_if(dialect='postgresql'))
+        event.listen(model.__table__, 'before_drop', DDL(
+            f'DROP TABLE IF EXISTS {self.name}'
+        ).execute_if(dialect='sqlite'))
+        event.listen(Session, 'after_flush', self.refresh_flushed)
+
+    def refresh_statements(self, ids):
+        # Postgres indexes the expression itself, only FTS5 needs a copy.
+        if self.dialect != 'sqlite' or not ids:
+            return []
+        ids = bindparam('ids', list(ids), expanding=True)
+        return [
+            text(f'DELETE FROM {self.name} WHERE rowid IN :ids')
+            .bindparams(ids),
+            text(
+                f'INSERT INTO {self.name} (rowid, {self.column.key}) '
+                f'SELECT id, {self.column.key} '
+                f'FROM {self.model.__tablename__} WHERE id IN :ids'
+            ).bindparams(ids)
+        ]
+
+    async def refresh(self, session, ids):
+        for statement in self.refresh_statements(ids):
+            await session.execute(statement)
+
+    def refresh_flushed(self, session, flush_context):
+        # Unit-of-work changes, e.g. from the admin, bypass the DAOs.
+        ids = {instance.id
+               for instance in (*session.new, *session.dirty, *session.deleted)
+               if isinstance(instance, self.model)}
+        for statement in self.refresh_statements(ids):
+            session.execute(statement)
+
+    def match(self, query: str):
+        terms = match_terms(query)
+        words = settings.SEARCH_SNIPPET_WORDS
+        if self.dialect == 'sqlite':
+            fts = table(self.name, column('rowid'))
+            fts_column = literal_column(self.name)
+            return (
+                fts.join(self.model, self.model.id == fts.c.rowid),
+                fts_column.op('MATCH')(
+                    ' '.join(f'"{term}"' for term in terms)),
+                # bm25() is lower for better matches.
+                -func.bm25(fts_column),
+                func.snippet(fts_column, 0, MATCH_START, MATCH_STOP,
+                             '…', words)
+            )
+
+        vector = func.to_tsvector(TS_CONFIG, self.column)
+        ts_query = func.to_tsquery(
+            TS_CONFIG, ' & '.join(f"'{term}'" for term in terms))
+        return (
+            self.model,
+            vector.op('@@')(ts_query),
+            func.ts_rank(vector, ts_query),
+            func.ts_headline(
+                TS_CONFIG, self.column, ts_query,
+                f'StartSel={MATCH_START}, StopSel={MATCH_STOP}, '
+                f'MaxWords={words}, MinWords={max(words // 2, 1)}'
+            )
+        )
+
+    async def search(self, session, query: str, columns, joins=(), where=(),
+                     offset: int = 0, limit: int = 10):
+        if not match_terms(query):
+            return []
+
+        source, criterion, rank, snippet = self.match(query)
+        statement = (
+            select(*columns, rank.label('rank'), snippet.label('snippet'))
+            .select_from(source)
+            .where(criterion, *where)
+        )
+        for join in joins:
+            statement = statement.outerjoin(join)
+        statement = (
+            statement
+            .order_by(rank.desc(), self.model.id.desc())
+            .offset(offset)
+            .limit(limit)
+        )
+
+        result = await session.execute(statement)
+        return [{**row, 'snippet': highlight(row['snippet'])}
+                for row in result.mappings()]
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import TypeAdapter
 
 from groups.schemas import SGroupResponse
+from http_cache import conditional_response, make_etag
 from posts.models import GroupDAO
 
 router = APIRouter(
@@ -8,6 +10,17 @@ router = APIRouter(
     tags=['Groups']
 )
 
+groups_adapter = TypeAdapter(list[SGroupResponse])
+
+
+def cached_answer(request: Request, body: bytes):
+    etag = make_etag(body)
+    not_modified = conditional_response(request, Response(), etag=etag)
+    if not_modified:
+        return not_modified
+    return Response(content=body, media_type='application/json',
+                    headers={'ETag': etag})
+
 
 @router.get(
     '',
@@ -15,8 +28,13 @@ router = APIRouter(
     summary='List of Communities',
     description='Retrieve a list of available communities.'
 )
-async def read_groups_all():
-    return await GroupDAO.find_all()
+async def read_groups_all(request: Request):
+    body = await GroupDAO.cache.get('all')
+    if body is None:
+        groups = await GroupDAO.find_all()
+        body = groups_adapter.dump_json(groups_adapter.validate_python(groups))
+        await GroupDAO.cache.set('all', body)
+    return cached_answer(request, body)
 
 
 @router.get(
@@ -25,8 +43,12 @@ async def read_groups_all():
     summary='Community Information',
     description='Retrieve information about a community by its ID.'
 )
-async def read_group_by_id(group_id: int):
-    group = await GroupDAO.find_one_or_none(id=group_id)
-    if group is None:
-        raise HTTPException(status_code=404)
-    return group
+async def read_group_by_id(group_id: int, request: Request):
+    body = await GroupDAO.cache.get(str(group_id))
+    if body is None:
+        group = await GroupDAO.find_one_or_none(id=group_id)
+        if group is None:
+            raise HTTPException(status_code=404)
+        body = SGroupResponse.model_validate(group).model_dump_json().encode()
+        await GroupDAO.cache.set(str(group_id), body)
+    return cached_answer(request, body)
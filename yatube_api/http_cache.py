@@ -0,0 +1,123 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+SAFE_METHODS = ('GET', 'HEAD')
+# Headers a 304 response has to repeat from the full response.
+NOT_MODIFIED_HEADERS = ('cache-control', 'etag', 'last-modified', 'vary')
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode())
+        digest.update(b'\0')
+    tag = f'"{digest.hexdigest()}"'
+    return f'W/{tag}' if weak else tag
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request_headers, etag: str | None = None,
+                    last_modified: str | None = None) -> bool:
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # GET revalidation uses the weak comparison.
+        tags = {tag.strip().removeprefix('W/')
+                for tag in if_none_match.split(',')}
+        return etag.removeprefix('W/') in tags
+
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        return (parsedate_to_datetime(last_modified)
+                <= parsedate_to_datetime(if_modified_since))
+    except (TypeError, ValueError):
+        return False
+
+
+def conditional_response(request: Request, response: Response,
+                         etag: str | None = None,
+                         last_modified: datetime | None = None):
+    if etag is not None:
+        response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+
+    if not is_not_modified(request.headers, etag,
+                           response.headers.get('last-modified')):
+        return None
+    return Response(status_code=304, headers={
+        name: value for name, value in response.headers.items()
+        if name in NOT_MODIFIED_HEADERS
+    })
+
+
+class HTTPCacheMiddleware:
+    def __init__(self, app, max_age: int, path_prefix: str = '/api/'):
+        self.app = app
+        self.max_age = max_age
+        self.path_prefix = path_prefix
+
+    def cache_control(self, request_headers) -> str:
+        if 'authorization' in request_headers or 'cookie' in request_headers:
+            return 'private, no-cache'
+        return f'public, max-age={self.max_age}'
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] not in SAFE_METHODS
+                or not scope['path'].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                start = message
+                headers = MutableHeaders(scope=start)
+                if start['status'] in (200, 304):
+                    headers.setdefault('Cache-Control',
+                                       self.cache_control(request_headers))
+                    headers.add_vary_header('Authorization')
+                return
+
+            if start is None or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            response, start = start, None
+            headers = MutableHeaders(scope=response)
+            # Streamed bodies are passed through untouched.
+            if response['status'] == 200 and not message.get('more_body'):
+                if 'etag' not in headers:
+                    headers['ETag'] = make_etag(message['body'], weak=True)
+                if is_not_modified(request_headers, headers['etag'],
+                                   headers.get('last-modified')):
+                    await send({
+                        'type': 'http.response.start',
+                        'status': 304,
+                        'headers': [(name, value)
+                                    for name, value in response['headers']
+                                    if name.decode() in NOT_MODIFIED_HEADERS]
+                    })
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+
+            await send(response)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,215 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from config import settings
+
+logger = logging.getLogger('yatube.queries')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0
+    rows: int = 0
+    slowest: float = 0
+    slowest_statement: str | None = None
+    # Statement text -> executions, bound values are not part of the text.
+    shapes: Counter = field(default_factory=Counter)
+    # Statements are recorded in every enclosing collector as well.
+    parent: 'QueryStats | None' = None
+
+    def record(self, statement: str, duration: float, rows: int):
+        self.count += 1
+        self.duration += duration
+        self.rows += rows
+        self.shapes[statement] += 1
+        if duration >= self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+        if self.parent is not None:
+            self.parent.record(statement, duration, rows)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(statement, times) for statement, times in self.shapes.items()
+                if times >= threshold]
+
+    def problems(self, budget: int | None, threshold: int) -> list[str]:
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(
+                f'{self.count} queries, the budget is {budget}')
+        problems.extend(f'possible N+1, {times} x {statement}'
+                        for statement, times in self.repeated(threshold))
+        return problems
+
+    def server_timing(self) -> str:
+        return (f'db;dur={self.duration * 1000:.2f};'
+                f'desc="queries={self.count} rows={self.rows}", '
+                f'db-slowest;dur={self.slowest * 1000:.2f}')
+
+
+current_stats: ContextVar[QueryStats | None] = ContextVar(
+    'current_query_stats', default=None)
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context,
+                          executemany):
+    context.query_start = time.perf_counter()
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context,
+                         executemany):
+    stats = current_stats.get()
+    if stats is None:
+        return
+
+    duration = time.perf_counter() - context.query_start
+    # The async driver adapters buffer the whole result on execute.
+    rows = (len(getattr(cursor, '_rows', ())) if cursor.description
+            else max(cursor.rowcount, 0))
+    stats.record(statement, duration, rows)
+
+
+def instrument_engine(engine):
+    event.listen(engine.sync_engine, 'before_cursor_execute',
+                 before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute',
+                 after_cursor_execute)
+
+
+@contextmanager
+def count_queries():
+    stats = QueryStats(parent=current_stats.get())
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+@contextmanager
+def assert_queries(budget: int | None = None,
+                   threshold: int = settings.QUERY_REPEAT_THRESHOLD):
+    with count_queries() as stats:
+        yield stats
+    problems = stats.problems(budget, threshold)
+    if problems:
+        raise QueryBudgetExceeded('; '.join(problems))
+
+
+def query_budget(budget):
+    # `budget` may be a callable evaluated per request, returning None
+    # exempts the request from the checks.
+    def decorator(endpoint):
+        endpoint.query_budget = budget
+        return endpoint
+    return decorator
+
+
+class QueryMetrics:
+    def __init__(self):
+        # (method, route) -> [requests, queries, seconds, rows,
+        # slowest seconds, requests with repeated statements]
+        self.routes = {}
+
+    def observe(self, method: str, route: str, stats: QueryStats,
+                repeated: bool):
+        totals = self.routes.setdefault((method, route), [0, 0, 0, 0, 0, 0])
+        totals[0] += 1
+        totals[1] += stats.count
+        totals[2] += stats.duration
+        totals[3] += stats.rows
+        totals[4] = max(totals[4], stats.slowest)
+        totals[5] += repeated
+
+    def render(self, gauges=None) -> str:
+        series = (
+            ('http_requests_total', 'counter', 'HTTP requests.'),
+            ('db_queries_total', 'counter', 'SQL statements executed.'),
+            ('db_query_seconds_total', 'counter',
+             'Time spent executing SQL statements.'),
+            ('db_rows_total', 'counter',
+             'Rows returned or affected by SQL statements.'),
+            ('db_slowest_query_seconds', 'gauge',
+             'Slowest SQL statement of a single request.'),
+            ('db_repeated_query_requests_total', 'counter',
+             'Requests repeating a statement at least '
+             f'{settings.QUERY_REPEAT_THRESHOLD} times.')
+        )
+        lines = []
+        for index, (name, kind, help_text) in enumerate(series):
+            lines.append(f'# HELP yatube_{name} {help_text}')
+            lines.append(f'# TYPE yatube_{name} {kind}')
+            lines.extend(
+                f'yatube_{name}{{method="{method}",route="{route}"}} '
+                f'{totals[index]}'
+                for (method, route), totals in sorted(self.routes.items()))
+
+        for name, value in (gauges or {}).items():
+            lines.append(f'# TYPE yatube_{name} gauge')
+            lines.append(f'yatube_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+query_metrics = QueryMetrics()
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app, checks: str = 'off',
+                 threshold: int = settings.QUERY_REPEAT_THRESHOLD,
+                 metrics: QueryMetrics = query_metrics):
+        self.app = app
+        self.checks = checks
+        self.threshold = threshold
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).append(
+                    'Server-Timing', stats.server_timing())
+            await send(message)
+
+        with count_queries() as stats:
+            await self.app(scope, receive, send_wrapper)
+
+        # The router stores the matched route in the shared scope.
+        route = scope.get('route')
+        path = route.path if route is not None else '<unmatched>'
+        repeated = stats.repeated(self.threshold)
+        self.metrics.observe(scope['method'], path, stats, bool(repeated))
+        if self.checks == 'off':
+            return
+
+        logger.debug('%s %s: %d queries in %.2f ms, slowest %.2f ms: %s',
+                     scope['method'], path, stats.count,
+                     stats.duration * 1000, stats.slowest * 1000,
+                     stats.slowest_statement)
+        endpoint = getattr(route, 'endpoint', None)
+        budget = getattr(endpoint, 'query_budget', None)
+        if callable(budget):
+            budget = budget()
+            if budget is None:
+                return
+        problems = stats.problems(budget, self.threshold)
+        if not problems:
+            return
+        if self.checks == 'raise':
+            raise QueryBudgetExceeded(
+                f'{scope["method"]} {path}: ' + '; '.join(problems))
+        for problem in problems:
+            logger.warning('%s %s: %s', scope['method'], path, problem)
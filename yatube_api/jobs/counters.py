@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import logging
+
+from config import settings
+from database import engine
+from posts.models import CommentDAO
+from users.models import FollowDAO
+
+logger = logging.getLogger(__name__)
+
+COUNTED_DAOS = (CommentDAO, FollowDAO)
+
+
+async def reconcile_counters(batch_size: int) -> int:
+    repaired = 0
+    for dao in COUNTED_DAOS:
+        dao_repaired = await dao.reconcile_counters(batch_size)
+        logger.info('%s: repaired %d counters', dao.__name__, dao_repaired)
+        repaired += dao_repaired
+    return repaired
+
+
+async def main(args):
+    try:
+        repaired = await reconcile_counters(args.batch_size)
+    finally:
+        await engine.dispose()
+    print(f'Repaired {repaired} counters.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Recount denormalized counters and fix the drifted ones.')
+    parser.add_argument('--batch-size', type=int,
+                        default=settings.COUNTER_RECONCILE_BATCH_SIZE)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -1,21 +1,63 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from sqladmin import Admin
 
 from admin.admin import UsersAdmin, GroupsAdmin, PostsAdmin, CommentsAdmin
-from database import engine
+from config import settings
+from database import engine, find_missing_indexes, request_session
+from http_cache import HTTPCacheMiddleware
+from instrumentation import QueryStatsMiddleware
+from ratelimit import AdmissionMiddleware
 
 from admin.auth import authentication_backend
 from comments.router import router as router_comments
+from feed.router import router as router_feed
 from groups.router import router as router_groups
+from metrics.router import router as router_metrics
 from posts.router import router as router_posts
+from search.router import router as router_search
 from users.router import router as router_users
+from users.tokens import keep_revocations_synced, sync_revocations
 
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    missing_indexes = await find_missing_indexes()
+    if missing_indexes:
+        logger.warning(
+            'Database is missing expected indexes: %s. '
+            'Run "alembic upgrade head" to apply pending migrations.',
+            ', '.join(sorted(missing_indexes))
+        )
+    try:
+        await sync_revocations()
+    except Exception:
+        logger.exception('Could not load token revocations.')
+    sync_task = asyncio.create_task(keep_revocations_synced(
+        settings.TOKEN_REVOCATION_SYNC_INTERVAL))
+    yield
+    sync_task.cancel()
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(request_session)])
+app.add_middleware(HTTPCacheMiddleware, max_age=settings.HTTP_CACHE_MAX_AGE)
+if settings.QUERY_STATS:
+    app.add_middleware(QueryStatsMiddleware, checks=settings.QUERY_CHECKS)
+if settings.ADMISSION_MAX_CONCURRENCY:
+    app.add_middleware(AdmissionMiddleware)
 app.include_router(router_posts)
 app.include_router(router_comments)
+app.include_router(router_feed)
 app.include_router(router_groups)
 app.include_router(router_users)
+app.include_router(router_search)
+app.include_router(router_metrics)
 
 admin = Admin(app, engine, authentication_backend=authentication_backend)
 
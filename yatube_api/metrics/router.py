@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from instrumentation import query_metrics
+from ratelimit import admission, rate_limiter
+from users.hashing import password_hasher
+
+router = APIRouter(tags=['Monitoring'])
+
+
+@router.get(
+    '/metrics',
+    response_class=PlainTextResponse,
+    summary='Metrics',
+    description=('Request and SQL statement counters per route in the '
+                 'Prometheus text format.')
+)
+async def read_metrics():
+    gauges = {f'password_hasher_{name}': value
+              for name, value in password_hasher.stats().items()}
+    gauges.update((f'admission_{name}', value)
+                  for name, value in admission.stats().items())
+    gauges['rate_limit_rejected'] = rate_limiter.rejected
+    return PlainTextResponse(query_metrics.render(gauges),
+                             media_type='text/plain; version=0.0.4')
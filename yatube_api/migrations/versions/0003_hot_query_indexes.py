@@ -0,0 +1,35 @@
+"""Add composite indexes for feed, group, comment and follow queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:38:44.902361
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_posts_pub_date_id', 'posts', ['pub_date', 'id'])
+    op.create_index('ix_posts_group_id_pub_date_id', 'posts',
+                    ['group_id', 'pub_date', 'id'])
+    op.create_index('ix_posts_author_id_pub_date_id', 'posts',
+                    ['author_id', 'pub_date', 'id'])
+    op.create_index('ix_comments_post_id_id', 'comments', ['post_id', 'id'])
+    op.create_index('ix_follows_following_id_user_id', 'follows',
+                    ['following_id', 'user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_follows_following_id_user_id', table_name='follows')
+    op.drop_index('ix_comments_post_id_id', table_name='comments')
+    op.drop_index('ix_posts_author_id_pub_date_id', table_name='posts')
+    op.drop_index('ix_posts_group_id_pub_date_id', table_name='posts')
+    op.drop_index('ix_posts_pub_date_id', table_name='posts')
@@ -0,0 +1,27 @@
+"""Index comments for keyset pagination by creation time
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:52:17.306115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_comments_post_id_created_id', 'comments',
+                    ['post_id', 'created', 'id'])
+    op.drop_index('ix_comments_post_id_id', table_name='comments')
+
+
+def downgrade() -> None:
+    op.create_index('ix_comments_post_id_id', 'comments', ['post_id', 'id'])
+    op.drop_index('ix_comments_post_id_created_id', table_name='comments')
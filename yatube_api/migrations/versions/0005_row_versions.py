@@ -0,0 +1,41 @@
+"""Add row versions and update times for HTTP validators
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 09:41:27.305114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('groups') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(),
+                                      server_default='1', nullable=False))
+
+    for table in ('posts', 'comments'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated',
+                                          sa.DateTime(timezone=True),
+                                          nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(),
+                                          server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    for table in ('comments', 'posts'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
+            batch_op.drop_column('updated')
+
+    with op.batch_alter_table('groups') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,39 @@
+"""Add full-text search indexes for posts and comments
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 09:52:16.774390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('posts', 'comments')
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'sqlite':
+            op.execute(f'CREATE VIRTUAL TABLE {table}_fts USING fts5(text)')
+            op.execute(f'INSERT INTO {table}_fts (rowid, text) '
+                       f'SELECT id, text FROM {table}')
+        elif dialect == 'postgresql':
+            op.execute(f'CREATE INDEX ix_{table}_fts ON {table} '
+                       f"USING gin (to_tsvector('simple', text))")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'sqlite':
+            op.execute(f'DROP TABLE {table}_fts')
+        elif dialect == 'postgresql':
+            op.execute(f'DROP INDEX ix_{table}_fts')
@@ -0,0 +1,43 @@
+"""Add comment and follow counters
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 09:58:41.201873
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(),
+                                      server_default='0', nullable=False))
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('follower_count', sa.Integer(),
+                                      server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('following_count', sa.Integer(),
+                                      server_default='0', nullable=False))
+
+    op.execute('UPDATE posts SET comment_count = (SELECT count(*) '
+               'FROM comments WHERE comments.post_id = posts.id)')
+    op.execute('UPDATE users SET follower_count = (SELECT count(*) '
+               'FROM follows WHERE follows.following_id = users.id), '
+               'following_count = (SELECT count(*) '
+               'FROM follows WHERE follows.user_id = users.id)')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('follower_count')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comment_count')
@@ -0,0 +1,46 @@
+"""Add refresh token families
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 10:24:06.315207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'token_families',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('current_jti', sa.String(length=32), nullable=False),
+        sa.Column('created', sa.DateTime(timezone=True),
+                  server_default=sa.func.now(),
+                  nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_token_families_user_id'), 'token_families',
+                    ['user_id'], unique=False)
+    op.create_index(op.f('ix_token_families_revoked_at'), 'token_families',
+                    ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_token_families_revoked_at'),
+                  table_name='token_families')
+    op.drop_index(op.f('ix_token_families_user_id'),
+                  table_name='token_families')
+    op.drop_table('token_families')
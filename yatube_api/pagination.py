@@ -0,0 +1,73 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+NEXT = 'next'
+PREVIOUS = 'prev'
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values, direction: str = NEXT) -> str:
+    raw = json.dumps({'d': direction, 'v': [_dump_value(v) for v in values]},
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _valid_value(value, expected: type) -> bool:
+    # Values are bound against the keyset columns, so a tampered cursor
+    # must not reach the driver with another type.
+    if type(value) is not expected:
+        return False
+    if expected is int:
+        return -2 ** 63 <= value < 2 ** 63
+    return True
+
+
+def decode_cursor(cursor: str, types):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = data['d']
+        values = [_load_value(v) for v in data['v']]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor.')
+
+    if direction not in (NEXT, PREVIOUS) or len(values) != len(types):
+        raise ValueError('Invalid cursor.')
+    if not all(_valid_value(value, expected)
+               for value, expected in zip(values, types)):
+        raise ValueError('Invalid cursor.')
+    return direction, values
+
+
+def make_page(items: list, keyset, direction: str, has_cursor: bool,
+              has_more: bool) -> KeysetPage:
+    backwards = direction == PREVIOUS
+    page = KeysetPage(items=items)
+    if items:
+        if has_more or backwards:
+            page.next_cursor = encode_cursor(
+                [getattr(items[-1], name) for name in keyset], NEXT)
+        if has_cursor and (has_more or not backwards):
+            page.previous_cursor = encode_cursor(
+                [getattr(items[0], name) for name in keyset], PREVIOUS)
+    return page
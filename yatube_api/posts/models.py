@@ -1,9 +1,13 @@
-from sqlalchemy import Column, DateTime, Integer, String, ForeignKey, Text
+from sqlalchemy import (Column, Integer, String, ForeignKey, Text, Index,
+                        literal_column)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from base import BaseDAO
-from database import Base
+from cache import ResponseCache
+from config import settings
+from database import Base, Timestamp
+from fulltext import SearchIndex
 
 
 class Group(Base):
@@ -13,15 +17,21 @@ class Group(Base):
     title = Column(String(100), nullable=False)
     slug = Column(String(100), unique=True, nullable=False)
     description = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default='1',
+                     onupdate=literal_column('version') + 1)
 
     post = relationship('Post', back_populates='group')
 
+    __mapper_args__ = {'eager_defaults': True}
+
     def __str__(self):
         return self.title
 
 
 class GroupDAO(BaseDAO):
     model = Group
+    cache = ResponseCache('groups', ttl=settings.GROUP_CACHE_TTL,
+                          tables=('groups',))
 
 
 class Post(Base):
@@ -29,21 +39,49 @@ class Post(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text, nullable=False)
-    pub_date = Column(DateTime(timezone=True), server_default=func.now())
+    pub_date = Column(Timestamp, server_default=func.now())
     author_id = Column(Integer, ForeignKey('users.id'))
     image = Column(String(255), nullable=True)
     group_id = Column(Integer, ForeignKey('groups.id'), nullable=True)
+    updated = Column(Timestamp, nullable=True, onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default='1',
+                     onupdate=literal_column('version') + 1)
+    comment_count = Column(Integer, nullable=False, default=0,
+                           server_default='0')
 
     author = relationship('User', back_populates='post', )
     group = relationship('Group', back_populates='post')
     comment = relationship('Comment', back_populates='post')
 
+    __table_args__ = (
+        Index('ix_posts_pub_date_id', 'pub_date', 'id'),
+        Index('ix_posts_group_id_pub_date_id', 'group_id', 'pub_date', 'id'),
+        Index('ix_posts_author_id_pub_date_id', 'author_id', 'pub_date', 'id'),
+    )
+    __mapper_args__ = {'eager_defaults': True}
+
     def __str__(self):
         return self.text[:25]
 
 
 class PostDAO(BaseDAO):
     model = Post
+    keyset = ('pub_date', 'id')
+    keyset_descending = True
+    search_index = SearchIndex(Post)
+    # Each filter combination is served by one of the posts indexes.
+    filters = {
+        'group': ('group_id', 'eq'),
+        'author': ('author_id', 'eq'),
+        'since': ('pub_date', 'ge'),
+        'until': ('pub_date', 'lt')
+    }
+    orderings = {
+        'pub_date': (('pub_date', 'id'), False),
+        '-pub_date': (('pub_date', 'id'), True),
+        'id': (('id',), False),
+        '-id': (('id',), True)
+    }
 
 
 class Comment(Base):
@@ -51,16 +89,27 @@ class Comment(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text, nullable=False)
-    created = Column(DateTime(timezone=True), server_default=func.now())
+    created = Column(Timestamp, server_default=func.now())
     author_id = Column(Integer, ForeignKey('users.id'))
     post_id = Column(Integer, ForeignKey('posts.id'))
+    updated = Column(Timestamp, nullable=True, onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default='1',
+                     onupdate=literal_column('version') + 1)
 
     author = relationship('User', back_populates='comment')
     post = relationship('Post', back_populates='comment')
 
+    __table_args__ = (
+        Index('ix_comments_post_id_created_id', 'post_id', 'created', 'id'),
+    )
+    __mapper_args__ = {'eager_defaults': True}
+
     def __str__(self):
         return self.text[:25]
 
 
 class CommentDAO(BaseDAO):
     model = Comment
+    keyset = ('created', 'id')
+    search_index = SearchIndex(Comment)
+    counters = (('post_id', Post, 'comment_count'),)
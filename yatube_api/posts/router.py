@@ -1,24 +1,41 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from datetime import datetime, timezone
+from typing import Literal
+from fastapi import (APIRouter, HTTPException, Depends, Query, Request, Body,
+                     Response)
 
 from config import settings
+from feed.timeline import timelines
+from http_cache import conditional_response, make_etag
+from instrumentation import query_budget
 from posts.models import PostDAO, GroupDAO
-from posts.schemas import SPostRequest, SPostResponse, SPostsResponse
-from users.auth import validate_access_token
-from users.models import User, UsersDAO
+from posts.schemas import (SPostRequest, SPostResponse, SPostsResponse,
+                           SPostBulkUpdate, SPostBulkResult)
+from ratelimit import check_user_limit, limit_by_user
+from responses import FastJSONResponse, rows_answer
+from users.auth import get_principal, validate_access_token
+from users.models import UsersDAO
+from users.schemas import SPrincipal
 
 router = APIRouter(
     prefix='/api/v1/posts',
     tags=['Publications']
 )
 
+POST_FIELDS = ('id', 'author', 'text', 'pub_date', 'image', 'group',
+               'comment_count')
+# SPostResponse fields in order, then the row version for ETags.
+POST_PROJECTION = PostDAO.projection(
+    'id', ('author', 'author.username'), 'text', 'pub_date', 'image',
+    ('group', 'group_id'), 'comment_count', 'version'
+)
+
 
-async def get_post_or_404(post_id: int, current_user: User):
+async def get_post_or_404(post_id: int, principal: SPrincipal):
     post = await PostDAO.find_one_or_none(id=post_id)
     if not post:
         raise HTTPException(status_code=404, detail='Post not found.')
 
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    if post.author_id != user.id:
+    if post.author_id != principal.uid:
         raise HTTPException(
             status_code=403,
             detail='You do not have permission to edit this post.'
@@ -26,60 +43,134 @@ async def get_post_or_404(post_id: int, current_user: User):
     return post
 
 
-def post_answer(post_data):
+def post_answer(post_data, author: str | None = None):
     answer = SPostResponse(
         id=post_data.id,
-        author=post_data.author.username,
+        author=author or post_data.author.username,
         text=post_data.text,
         pub_date=post_data.pub_date,
         image=post_data.image,
-        group=post_data.group_id
+        group=post_data.group_id,
+        comment_count=post_data.comment_count
     )
     return answer
 
 
+def naive_utc(value: datetime | None):
+    # pub_date is stored as naive UTC.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 @router.get(
     '',
     response_model=SPostsResponse,
     summary='Get Publications',
     description=(
         'Retrieve a list of all publications. When using the `limit` '
-        'and `offset` parameters, the output should support pagination.'
+        'and `offset` parameters, the output should support pagination. '
+        'Passing `cursor` (empty for the first page) switches to keyset '
+        'pagination ordered from newest to oldest publications. `count_mode` '
+        'selects an exact, cached or estimated total `count`. Publications '
+        'can be filtered by `group`, `author` and a `since`/`until` '
+        'publication date range and sorted with `ordering`.'
     )
 )
+@query_budget(3)
 async def read_posts(
         request: Request,
+        response: Response,
         limit: int = Query(
             default=settings.PAGINATION_DEFAULT_LIMIT,
             ge=settings.PAGINATION_DEFAULT_LIMIT_MIN,
             le=settings.PAGINATION_DEFAULT_LIMIT_MAX
         ),
-        offset: int = Query(default=0, ge=0)
+        offset: int = Query(default=0, ge=0),
+        cursor: str | None = Query(default=None),
+        count_mode: Literal['exact', 'cached', 'estimated'] | None = Query(
+            default=None),
+        group: int | None = Query(default=None, ge=1),
+        author: str | None = Query(default=None, min_length=1),
+        since: datetime | None = Query(default=None),
+        until: datetime | None = Query(default=None),
+        ordering: Literal['pub_date', '-pub_date', 'id', '-id'] | None = Query(
+            default=None)
 ):
-    posts = await PostDAO.find_all_with_pagination(
-        'author', offset=offset, limit=limit)
-    answer = [post_answer(post) for post in posts]
+    since, until = naive_utc(since), naive_utc(until)
+    if since and until and since >= until:
+        raise HTTPException(status_code=400,
+                            detail='`since` must be earlier than `until`.')
 
-    total_count = await PostDAO.get_total_count()
+    filters = {'group': group, 'since': since, 'until': until}
+    if author is not None:
+        user = await UsersDAO.find_one_or_none(username=author)
+        if not user:
+            raise HTTPException(status_code=404,
+                                detail='There is no user with this name.')
+        filters['author'] = user.id
 
-    base_url = str(request.url).split('?')[0]
-    next_url = (
-        f'{base_url}?offset={offset + limit}&limit={limit}'
-        if len(answer) == limit
-        else None
-    )
-    previous_url = (
-        f'{base_url}?offset={max(offset - limit, 0)}&limit={limit}'
-        if offset > 0
-        else None
-    )
+    if cursor is not None:
+        try:
+            page = await PostDAO.find_all_with_keyset(
+                cursor=cursor, limit=limit, filters=filters,
+                ordering=ordering, **POST_PROJECTION)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Invalid cursor.')
+
+        posts = page.items
+        next_url = (
+            str(request.url.include_query_params(cursor=page.next_cursor))
+            if page.next_cursor
+            else None
+        )
+        previous_url = (
+            str(request.url.include_query_params(
+                cursor=page.previous_cursor))
+            if page.previous_cursor
+            else None
+        )
+    else:
+        posts = await PostDAO.find_all_with_pagination(
+            offset=offset, limit=limit, filters=filters, ordering=ordering,
+            **POST_PROJECTION)
+
+        next_url = (
+            str(request.url.include_query_params(offset=offset + limit,
+                                                 limit=limit))
+            if len(posts) == limit
+            else None
+        )
+        previous_url = (
+            str(request.url.include_query_params(
+                offset=max(offset - limit, 0), limit=limit))
+            if offset > 0
+            else None
+        )
 
-    return {
+    total_count, count_mode = await PostDAO.get_count(count_mode,
+                                                      filters=filters)
+
+    # Weak, since count_mode may differ between otherwise equal responses.
+    etag = make_etag('posts', [(post.id, post.version) for post in posts],
+                     total_count, next_url, previous_url, weak=True)
+    not_modified = conditional_response(request, response, etag=etag)
+    if not_modified:
+        return not_modified
+
+    answer = {
         'count': total_count,
+        'count_mode': count_mode,
         'next': next_url,
-        'previous': previous_url,
-        'results': answer
+        'previous': previous_url
     }
+    if settings.FAST_SERIALIZATION:
+        answer['results'] = rows_answer(POST_FIELDS, posts)
+        return FastJSONResponse(answer, headers=dict(response.headers))
+
+    answer['results'] = [SPostResponse.model_validate(post._mapping)
+                         for post in posts]
+    return answer
 
 
 @router.post(
@@ -87,28 +178,171 @@ async def read_posts(
     response_model=SPostResponse,
     summary='Create Publication',
     description=('Add a new publication to the collection of publications. '
-                 'Anonymous requests are not allowed.')
+                 'Anonymous requests are not allowed.'),
+    dependencies=[Depends(validate_access_token),
+                  Depends(limit_by_user('post'))]
 )
 async def create_post(post_data: SPostRequest,
-                      current_user: dict = Depends(validate_access_token)):
+                      principal: SPrincipal = Depends(get_principal)):
     if post_data.group:
         group = await GroupDAO.find_one_or_none(id=post_data.group)
         if not group:
             raise HTTPException(status_code=404, detail='Group not found.')
 
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    if not user:
-        raise HTTPException(status_code=404, detail='User error.')
-
     new_post = await PostDAO.add(
-        'author',
         text=post_data.text,
         image=post_data.image,
         group_id=post_data.group,
-        author_id=user.id
+        author_id=principal.uid
+    )
+    await timelines.push([new_post])
+
+    return post_answer(new_post, author=principal.username)
+
+
+async def get_existing_group_ids(posts_data) -> set[int]:
+    group_ids = {post_data.group for post_data in posts_data
+                 if post_data.group}
+    if not group_ids:
+        return set()
+    groups = await GroupDAO.find_all_by_ids(group_ids)
+    return {group.id for group in groups}
+
+
+@router.post(
+    '/bulk',
+    response_model=list[SPostBulkResult],
+    summary='Create Publications',
+    description=('Add several publications in one request and return a '
+                 'result for each of them. Anonymous requests are not '
+                 'allowed.'),
+    dependencies=[Depends(validate_access_token)]
+)
+async def create_posts_bulk(
+    posts_data: list[SPostRequest] = Body(
+        ..., max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    # Every publication counts against the limit, not the request.
+    await check_user_limit('post_bulk', principal,
+                           cost=max(len(posts_data), 1))
+    group_ids = await get_existing_group_ids(posts_data)
+
+    results, rows, indexes = [], [], []
+    for index, post_data in enumerate(posts_data):
+        if post_data.group and post_data.group not in group_ids:
+            results.append(SPostBulkResult(index=index, status=404,
+                                           detail='Group not found.'))
+            continue
+        rows.append({
+            'text': post_data.text,
+            'image': post_data.image,
+            'group_id': post_data.group,
+            'author_id': principal.uid
+        })
+        indexes.append(index)
+
+    new_posts = await PostDAO.add_many(rows)
+    await timelines.push(new_posts)
+    results.extend(
+        SPostBulkResult(index=index, status=200, id=post.id,
+                        result=post_answer(post, author=principal.username))
+        for index, post in zip(indexes, new_posts)
+    )
+    return sorted(results, key=lambda result: result.index)
+
+
+@router.put(
+    '/bulk',
+    response_model=list[SPostBulkResult],
+    summary='Update Publications',
+    description=(
+        'Update several publications by their IDs and return a result for '
+        'each of them. Only the author of a publication can update it. '
+        'Anonymous requests are not allowed.'
+    ),
+    dependencies=[Depends(validate_access_token)]
+)
+async def update_posts_bulk(
+    posts_data: list[SPostBulkUpdate] = Body(
+        ..., max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    posts = await PostDAO.find_all_by_ids(
+        {post_data.id for post_data in posts_data})
+    authors = {post.id: post.author_id for post in posts}
+    group_ids = await get_existing_group_ids(posts_data)
+
+    results, rows, indexes = [], [], []
+    for index, post_data in enumerate(posts_data):
+        if post_data.id not in authors:
+            results.append(SPostBulkResult(index=index, status=404,
+                                           id=post_data.id,
+                                           detail='Post not found.'))
+        elif authors[post_data.id] != principal.uid:
+            results.append(SPostBulkResult(
+                index=index, status=403, id=post_data.id,
+                detail='You do not have permission to edit this post.'))
+        elif post_data.group and post_data.group not in group_ids:
+            results.append(SPostBulkResult(index=index, status=404,
+                                           id=post_data.id,
+                                           detail='Group not found.'))
+        else:
+            data = {'id': post_data.id, 'text': post_data.text}
+            if post_data.group:
+                data.update({'group_id': post_data.group})
+            if post_data.image:
+                data.update({'image': post_data.image})
+            rows.append(data)
+            indexes.append(index)
+
+    updated_posts = {post.id: post
+                     for post in await PostDAO.update_many(rows)}
+    results.extend(
+        SPostBulkResult(index=index, status=200, id=row['id'],
+                        result=post_answer(updated_posts[row['id']],
+                                           author=principal.username))
+        for index, row in zip(indexes, rows)
     )
+    return sorted(results, key=lambda result: result.index)
+
+
+@router.post(
+    '/bulk/delete',
+    response_model=list[SPostBulkResult],
+    summary='Delete Publications',
+    description=(
+        'Delete several publications by their IDs and return a result for '
+        'each of them. Only the author of a publication can delete it. '
+        'Anonymous requests are not allowed.'
+    ),
+    dependencies=[Depends(validate_access_token)]
+)
+async def delete_posts_bulk(
+    ids: list[int] = Body(..., embed=True, max_length=settings.BULK_MAX_ITEMS),
+    principal: SPrincipal = Depends(get_principal)
+):
+    posts = await PostDAO.find_all_by_ids(set(ids))
+    authors = {post.id: post.author_id for post in posts}
+
+    results, allowed = [], []
+    for index, post_id in enumerate(ids):
+        if post_id not in authors:
+            results.append(SPostBulkResult(index=index, status=404,
+                                           id=post_id,
+                                           detail='Post not found.'))
+        elif authors[post_id] != principal.uid:
+            results.append(SPostBulkResult(
+                index=index, status=403, id=post_id,
+                detail='You do not have permission to edit this post.'))
+        else:
+            results.append(SPostBulkResult(index=index, status=200,
+                                           id=post_id))
+            allowed.append(post_id)
 
-    return post_answer(new_post)
+    await PostDAO.delete_many(allowed)
+    timelines.discard(allowed)
+    return results
 
 
 @router.get(
@@ -117,10 +351,20 @@ async def create_post(post_data: SPostRequest,
     summary='Get Publication',
     description='Retrieve a publication by its ID.'
 )
-async def read_post_by_id(post_id: int):
+@query_budget(1)
+async def read_post_by_id(post_id: int, request: Request,
+                          response: Response):
     post = await PostDAO.find_one_or_none('author', id=post_id)
     if post is None:
         raise HTTPException(status_code=404)
+
+    not_modified = conditional_response(
+        request, response,
+        etag=make_etag('post', post.id, post.version, post.author.username),
+        last_modified=post.updated or post.pub_date
+    )
+    if not_modified:
+        return not_modified
     return post_answer(post_data=post)
 
 
@@ -131,11 +375,12 @@ async def read_post_by_id(post_id: int):
     description=(
         'Update a publication by its ID. Only the author of the '
         'publication can update it. Anonymous requests are not allowed.'
-    )
+    ),
+    dependencies=[Depends(validate_access_token)]
 )
 async def update_post(post_id: int, post_data: SPostRequest,
-                      current_user: dict = Depends(validate_access_token)):
-    await get_post_or_404(post_id, current_user)
+                      principal: SPrincipal = Depends(get_principal)):
+    await get_post_or_404(post_id, principal)
 
     if post_data.group:
         group = await GroupDAO.find_one_or_none(id=post_data.group)
@@ -148,9 +393,9 @@ async def update_post(post_id: int, post_data: SPostRequest,
     if post_data.image:
         data.update({'image': post_data.image})
 
-    updated_post = await PostDAO.update(post_id, 'author', **data)
+    updated_post = await PostDAO.update(post_id, **data)
 
-    return post_answer(post_data=updated_post)
+    return post_answer(post_data=updated_post, author=principal.username)
 
 
 @router.delete(
@@ -159,9 +404,11 @@ async def update_post(post_id: int, post_data: SPostRequest,
     description=(
         'Delete a publication by its ID. Only the author of the publication '
         'can delete it. Anonymous requests are not allowed.'
-    )
+    ),
+    dependencies=[Depends(validate_access_token)]
 )
 async def delete_post(post_id: int,
-                      current_user: dict = Depends(validate_access_token)):
-    await get_post_or_404(post_id, current_user)
+                      principal: SPrincipal = Depends(get_principal)):
+    await get_post_or_404(post_id, principal)
     await PostDAO.delete(model_id=post_id)
+    timelines.discard([post_id])
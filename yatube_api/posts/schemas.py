@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
 
@@ -9,6 +9,10 @@ class SPostRequest(BaseModel):
     group: Optional[int] = Field(None)
 
 
+class SPostBulkUpdate(SPostRequest):
+    id: int
+
+
 class SPostResponse(BaseModel):
     id: int
     author: str
@@ -16,10 +20,23 @@ class SPostResponse(BaseModel):
     pub_date: datetime
     image: str | None
     group: int | None
+    comment_count: int = 0
 
 
 class SPostsResponse(BaseModel):
     count: int
+    count_mode: Literal['exact', 'cached', 'estimated'] = 'exact'
     next: Optional[str] = None
     previous: Optional[str] = None
     results: list[SPostResponse]
+
+
+class SBulkResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class SPostBulkResult(SBulkResult):
+    result: Optional[SPostResponse] = None
@@ -0,0 +1,205 @@
+import asyncio
+import math
+import time
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from cache import TTLCache
+from config import settings
+from users.auth import get_principal
+from users.schemas import SPrincipal
+
+REDIS_PREFIX = 'ratelimit'
+REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate = capacity / period
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(period * 1000))
+return tostring(wait)
+"""
+
+
+class MemoryRateLimitBackend:
+    def __init__(self, maxsize: int):
+        # A bucket left alone for `period` is full again, so dropping it
+        # on expiry changes nothing.
+        self._buckets = TTLCache(maxsize=maxsize, ttl=0)
+
+    async def take(self, key: str, capacity: int, period: float,
+                   cost: int = 1) -> float:
+        now = time.monotonic()
+        rate = capacity / period
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+
+        wait = 0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets.set(key, (tokens, now), ttl=period)
+        return wait
+
+
+class RedisRateLimitBackend:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('The redis rate limit backend requires the '
+                               '"redis" package.')
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(REDIS_TAKE)
+
+    async def take(self, key: str, capacity: int, period: float,
+                   cost: int = 1) -> float:
+        wait = await self._take(keys=[f'{REDIS_PREFIX}:{key}'],
+                                args=[capacity, period, cost])
+        return float(wait)
+
+
+def create_backend():
+    if settings.RATE_LIMIT_BACKEND == 'redis':
+        return RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryRateLimitBackend(settings.RATE_LIMIT_MAXSIZE)
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.rejected = 0
+
+    async def check(self, name: str, identity, cost: int = 1):
+        limit = settings.RATE_LIMITS.get(name)
+        if not settings.RATE_LIMIT_ENABLED or limit is None:
+            return
+
+        capacity, period = limit
+        if cost > capacity:
+            # Waiting would never help, the bucket cannot hold the cost.
+            raise HTTPException(
+                status_code=413,
+                detail=f'At most {capacity} items are allowed per request.'
+            )
+        wait = await self.backend.take(f'{name}:{identity}', capacity, period,
+                                       cost)
+        if wait > 0:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail='Too many requests.',
+                headers={'Retry-After': str(math.ceil(wait))}
+            )
+
+
+rate_limiter = RateLimiter(create_backend())
+
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy run uvicorn with --proxy-headers to get the real peer.
+    return request.client.host if request.client else 'unknown'
+
+
+def limit_by_ip(name: str):
+    async def dependency(request: Request):
+        await rate_limiter.check(name, f'ip:{client_ip(request)}')
+    return dependency
+
+
+async def check_user_limit(name: str, principal: SPrincipal,
+                           cost: int = 1):
+    await rate_limiter.check(name, f'user:{principal.uid}', cost)
+
+
+def limit_by_user(name: str):
+    async def dependency(principal: SPrincipal = Depends(get_principal)):
+        await check_user_limit(name, principal)
+    return dependency
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, queue: int, timeout: float):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked() and self.waiting >= self.queue:
+            self.shed += 1
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'shed': self.shed
+        }
+
+
+admission = ConcurrencyLimiter(limit=settings.ADMISSION_MAX_CONCURRENCY,
+                               queue=settings.ADMISSION_MAX_QUEUE,
+                               timeout=settings.ADMISSION_QUEUE_TIMEOUT)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, limiter: ConcurrencyLimiter = admission,
+                 path_prefix: str = '/api/'):
+        self.app = app
+        self.limiter = limiter
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http'
+                or not scope['path'].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        # Past the queue limit requests are turned away at once instead of
+        # piling up in front of the connection pool.
+        if not await self.limiter.acquire():
+            response = JSONResponse(
+                {'detail': 'The server is busy, try again later.'},
+                status_code=503,
+                headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
@@ -0,0 +1,14 @@
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class FastJSONResponse(ORJSONResponse):
+    # OPT_UTC_Z keeps datetimes in the same format pydantic writes them.
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def rows_answer(fields, rows) -> list[dict]:
+    # Rows may carry extra trailing columns, zip() drops them.
+    return [dict(zip(fields, row)) for row in rows]
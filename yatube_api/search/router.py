@@ -0,0 +1,78 @@
+from typing import Literal
+from fastapi import APIRouter, Query, Request
+from sqlalchemy import select
+
+from comments.router import COMMENT_PROJECTION
+from config import settings
+from instrumentation import query_budget
+from posts.models import Comment, CommentDAO, Post, PostDAO
+from posts.router import POST_PROJECTION
+from search.schemas import (SSearchResponse, SPostSearchResult,
+                            SCommentSearchResult)
+from users.models import User
+
+router = APIRouter(
+    prefix='/api/v1/search',
+    tags=['Search']
+)
+
+
+@router.get(
+    '',
+    response_model=SSearchResponse,
+    summary='Search',
+    description=(
+        'Full-text search over publications or comments, ordered by '
+        'relevance. Results can be narrowed down to a community and an '
+        'author, and carry a `snippet` with the matched words highlighted.'
+    )
+)
+@query_budget(3)
+async def search(
+        request: Request,
+        q: str = Query(..., min_length=1),
+        type: Literal['posts', 'comments'] = Query(default='posts'),
+        group: int | None = Query(default=None),
+        author: str | None = Query(default=None),
+        limit: int = Query(
+            default=settings.PAGINATION_DEFAULT_LIMIT,
+            ge=settings.PAGINATION_DEFAULT_LIMIT_MIN,
+            le=settings.PAGINATION_DEFAULT_LIMIT_MAX
+        ),
+        offset: int = Query(default=0, ge=0)
+):
+    if type == 'posts':
+        dao, model, projection = PostDAO, Post, POST_PROJECTION
+        schema = SPostSearchResult
+    else:
+        dao, model, projection = CommentDAO, Comment, COMMENT_PROJECTION
+        schema = SCommentSearchResult
+
+    where = []
+    if group is not None:
+        if model is Post:
+            where.append(Post.group_id == group)
+        else:
+            where.append(Comment.post_id.in_(
+                select(Post.id).where(Post.group_id == group)))
+    if author is not None:
+        where.append(model.author_id == select(User.id).where(
+            User.username == author).scalar_subquery())
+
+    rows = await dao.search(q, offset=offset, limit=limit + 1, where=where,
+                            **projection)
+
+    return {
+        'next': (
+            str(request.url.include_query_params(offset=offset + limit))
+            if len(rows) > limit
+            else None
+        ),
+        'previous': (
+            str(request.url.include_query_params(
+                offset=max(offset - limit, 0)))
+            if offset > 0
+            else None
+        ),
+        'results': [schema.model_validate(row) for row in rows[:limit]]
+    }
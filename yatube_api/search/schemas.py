@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Optional
+
+from comments.schemas import SCommentResponse
+from posts.schemas import SPostResponse
+
+
+class SPostSearchResult(SPostResponse):
+    rank: float
+    snippet: str
+
+
+class SCommentSearchResult(SCommentResponse):
+    rank: float
+    snippet: str
+
+
+class SSearchResponse(BaseModel):
+    next: Optional[str] = None
+    previous: Optional[str] = None
+    results: list[SPostSearchResult] | list[SCommentSearchResult]
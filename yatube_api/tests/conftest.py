@@ -0,0 +1,32 @@
+import asyncio
+import os
+import tempfile
+import pytest
+
+DATABASE_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-' + '0' * 16)
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('PASSWORD_HASH_ROUNDS', '4')
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ['DATABASE_URL'] = (
+    f'sqlite+aiosqlite:///{os.path.join(DATABASE_DIR, "test.db")}')
+
+
+@pytest.fixture
+def run():
+    from database import Base, engine
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    def runner(coroutine):
+        async def main():
+            try:
+                await create_tables()
+                return await coroutine
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return runner
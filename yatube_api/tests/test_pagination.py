@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+import pytest
+
+from pagination import NEXT, decode_cursor, encode_cursor
+
+KEYSET_TYPES = [datetime, int]
+
+
+def raw_cursor(values, direction=NEXT):
+    raw = json.dumps({'d': direction, 'v': values}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    values = [datetime(2020, 1, 1, 12, 30), 42]
+    assert decode_cursor(encode_cursor(values), KEYSET_TYPES) == (
+        NEXT, values)
+
+
+@pytest.mark.parametrize('values', [
+    ['x', 1],
+    [[1], 2],
+    [{'dt': '2020-01-01T00:00:00'}, 'abc'],
+    [{'dt': '2020-01-01T00:00:00'}, True],
+    [{'dt': '2020-01-01T00:00:00'}, 1.5],
+    [{'dt': '2020-01-01T00:00:00'}, 10 ** 30],
+    [{'dt': 5}, 1],
+    [None, 1],
+    [{'dt': '2020-01-01T00:00:00'}]
+])
+def test_cursor_values_must_match_keyset_types(values):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(values), KEYSET_TYPES)
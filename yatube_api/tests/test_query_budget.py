@@ -0,0 +1,90 @@
+import httpx
+import pytest
+
+from config import settings
+from feed.router import read_feed
+from instrumentation import (QueryBudgetExceeded, QueryStatsMiddleware,
+                             assert_queries)
+from main import app
+from posts.router import read_posts
+
+
+def client():
+    transport = httpx.ASGITransport(
+        app=QueryStatsMiddleware(app, checks='raise'))
+    return httpx.AsyncClient(transport=transport, base_url='http://test')
+
+
+async def register(client, name):
+    credentials = {'email': f'{name}@example.com', 'password': 'password'}
+    response = await client.post('/api/v1/register',
+                                 json=credentials | {'name': name})
+    assert response.status_code == 200, response.text
+    response = await client.post('/api/v1/jwt/create', json=credentials)
+    assert response.status_code == 200, response.text
+    return {'Authorization': f'Bearer {response.json()["access"]}'}
+
+
+async def follow_authors(client, count):
+    headers = await register(client, 'reader')
+    for index in range(count):
+        author = f'author{index}'
+        author_headers = await register(client, author)
+        response = await client.post('/api/v1/posts', json={'text': author},
+                                     headers=author_headers)
+        assert response.status_code == 200, response.text
+        response = await client.post('/api/v1/follow',
+                                     json={'following': author},
+                                     headers=headers)
+        assert response.status_code == 200, response.text
+    return headers
+
+
+def test_route_within_budget(run):
+    async def scenario():
+        async with client() as test_client:
+            headers = await register(test_client, 'author')
+            for index in range(5):
+                await test_client.post('/api/v1/posts',
+                                       json={'text': f'post {index}'},
+                                       headers=headers)
+            with assert_queries(read_posts.query_budget) as stats:
+                response = await test_client.get('/api/v1/posts')
+            assert response.status_code == 200
+            assert response.json()['count'] == 5
+            assert 0 < stats.count <= read_posts.query_budget
+
+    run(scenario())
+
+
+def test_route_over_budget_raises(run, monkeypatch):
+    monkeypatch.setattr(read_posts, 'query_budget', 0)
+
+    async def scenario():
+        async with client() as test_client:
+            with pytest.raises(QueryBudgetExceeded, match='the budget is 0'):
+                await test_client.get('/api/v1/posts')
+            with pytest.raises(QueryBudgetExceeded):
+                with assert_queries(0):
+                    await test_client.get('/api/v1/groups')
+
+    run(scenario())
+
+
+@pytest.mark.parametrize('strategy', ['join', 'fanout', 'materialized'])
+def test_feed_budget_follows_strategy(run, monkeypatch, strategy):
+    monkeypatch.setattr(settings, 'FEED_STRATEGY', strategy)
+
+    async def scenario():
+        async with client() as test_client:
+            headers = await follow_authors(test_client, 4)
+            response = await test_client.get('/api/v1/feed',
+                                             headers=headers)
+            assert response.status_code == 200
+            assert len(response.json()['results']) == 4
+
+    run(scenario())
+    if strategy == 'fanout':
+        assert read_feed.query_budget() is None
+    else:
+        assert read_feed.query_budget() == 3
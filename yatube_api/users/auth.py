@@ -1,24 +1,26 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
-from pydantic import EmailStr
+from pydantic import EmailStr, ValidationError
 
+from cache import TTLCache
 from config import settings
-from users.models import UsersDAO
+from users.hashing import password_hasher
+from users.models import User, UsersDAO
+from users.schemas import SPrincipal
+from users.tokens import is_revoked
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+CLAIMS_VERSION = 2
+# Tokens issued before key ids were added carry no kid header.
+LEGACY_KEY_ID = '1'
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
-
-
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Token digest -> verified principal, kept until the token expires.
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_MAXSIZE,
+                       ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 
 def create_token(data: dict, token_type: str = 'access'):
@@ -35,23 +37,59 @@ def create_token(data: dict, token_type: str = 'access'):
     to_encode.update(data)
 
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY,
-                             settings.ALGORITHM)
+                             settings.ALGORITHM,
+                             headers={'kid': settings.JWT_KEY_ID})
     return encoded_jwt
 
 
+def verification_keys() -> dict[str, str]:
+    return {**settings.JWT_PREVIOUS_KEYS,
+            settings.JWT_KEY_ID: settings.SECRET_KEY}
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def token_claims(user: User) -> dict:
+    return {
+        'sub': str(user.email),
+        'uid': user.id,
+        'role': user.role,
+        'username': user.username,
+        'ver': CLAIMS_VERSION,
+        'tv': user.token_version
+    }
+
+
 async def authenticate_user(email: EmailStr, password: str):
     user = await UsersDAO.find_one_or_none(email=email)
-    if not user or not verify_password(password, user.password):
+    if not user:
         return None
+
+    verified, new_hash = await password_hasher.verify_and_update(
+        password, user.password)
+    if not verified:
+        return None
+    if new_hash:
+        await UsersDAO.update(model_id=user.id, password=new_hash)
     return user
 
 
-async def get_token_payload(token: str = Depends(oauth2_scheme)):
+def decode_token(token: str) -> SPrincipal:
+    digest = token_digest(token)
+    principal = token_cache.get(digest)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(status_code=401,
                                           detail='Invalid token.')
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY,
-                             algorithms=[settings.ALGORITHM])
+        key_id = jwt.get_unverified_header(token).get('kid', LEGACY_KEY_ID)
+        key = verification_keys().get(key_id)
+        if key is None:
+            raise credentials_exception
+        payload = jwt.decode(token, key, algorithms=[settings.ALGORITHM])
     except JWTError:
         raise credentials_exception
 
@@ -60,15 +98,48 @@ async def get_token_payload(token: str = Depends(oauth2_scheme)):
     if not expire or expire < current_time:
         raise HTTPException(status_code=401,
                             detail='Token expired.')
-    return payload
+
+    try:
+        principal = SPrincipal.model_validate(payload)
+    except ValidationError:
+        raise credentials_exception
+
+    token_cache.set(digest, principal, ttl=expire - time.time())
+    return principal
+
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)):
+    principal = decode_token(token)
+    if is_revoked(principal):
+        raise HTTPException(status_code=401,
+                            detail='Token has been revoked.')
+    return principal
 
 
 async def validate_access_token(
-        current_user: dict = Depends(get_token_payload)):
-    token_type = current_user.get('token_type')
-    if token_type != 'access':
+        principal: SPrincipal = Depends(get_token_payload)) -> SPrincipal:
+    if principal.token_type != 'access':
         raise HTTPException(
             status_code=401,
             detail='Invalid token type. Expected access token.'
         )
-    return current_user
+    return principal
+
+
+async def get_current_user(
+        principal: SPrincipal = Depends(get_token_payload)) -> User:
+    user = await UsersDAO.find_by_email(principal.sub)
+    if not user:
+        raise HTTPException(status_code=404, detail='User error.')
+    return user
+
+
+async def get_principal(
+        principal: SPrincipal = Depends(get_token_payload)) -> SPrincipal:
+    if principal.uid is not None:
+        return principal
+
+    # Tokens issued before claims were versioned only carry the email.
+    user = await get_current_user(principal)
+    return principal.model_copy(update={
+        'uid': user.id, 'role': user.role, 'username': user.username})
@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from passlib.context import CryptContext
+
+from config import settings
+
+pwd_context = CryptContext(
+    schemes=['bcrypt'],
+    deprecated='auto',
+    bcrypt__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    bcrypt__max_rounds=settings.PASSWORD_HASH_ROUNDS
+)
+
+
+# Module-level so that process pool workers can unpickle them.
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: str, workers: int):
+        self.executor_type = executor
+        self.workers = workers
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.max_waiting = 0
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(workers)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='password-hasher'
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, plain_password: str,
+                                hashed_password: str):
+        return await self._run(_verify_and_update, plain_password,
+                               hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'in_flight': self.in_flight,
+            'completed': self.completed
+        }
+
+
+password_hasher = PasswordHasher(executor=settings.PASSWORD_HASH_EXECUTOR,
+                                 workers=settings.PASSWORD_HASH_WORKERS)
@@ -1,10 +1,14 @@
+from contextlib import asynccontextmanager
 from sqlalchemy import (Column, DateTime, Integer, String, ForeignKey,
-                        UniqueConstraint)
-from sqlalchemy.orm import relationship
+                        Index, UniqueConstraint, and_, event, inspect, select,
+                        update)
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 
 from base import BaseDAO
-from database import Base
+from cache import TTLCache
+from config import settings
+from database import Base, Timestamp, async_session_maker
 
 
 class User(Base):
@@ -19,6 +23,12 @@ class User(Base):
     role = Column(String, default='user')
     first_name = Column(String, index=True, nullable=True)
     last_name = Column(String, index=True, nullable=True)
+    token_version = Column(Integer, nullable=False, default=0,
+                           server_default='0')
+    follower_count = Column(Integer, nullable=False, default=0,
+                            server_default='0')
+    following_count = Column(Integer, nullable=False, default=0,
+                             server_default='0')
 
     post = relationship('Post', back_populates='author')
     comment = relationship('Comment', back_populates='author')
@@ -31,8 +41,59 @@ class User(Base):
         return self.username
 
 
+@event.listens_for(Session, 'before_flush')
+def revoke_tokens_on_role_change(session, flush_context, instances):
+    # Tokens carry the role, e.g. a demoted admin must not keep admin access.
+    for instance in session.dirty:
+        if (isinstance(instance, User)
+                and inspect(instance).attrs.role.history.deleted):
+            instance.token_version = User.token_version + 1
+
+
 class UsersDAO(BaseDAO):
     model = User
+    cache = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE,
+                     ttl=settings.USER_CACHE_TTL)
+
+    @classmethod
+    async def find_by_email(cls, email: str):
+        user = cls.cache.get(email)
+        if user is not None:
+            return user
+
+        async with cls.session() as session:
+            result = await session.execute(select(User).filter_by(email=email))
+            user = result.scalar_one_or_none()
+            if user is not None:
+                # Detach the cached instance so a rollback of the request
+                # session cannot expire it under other requests.
+                session.expunge(user)
+                cls.cache.set(email, user)
+        return user
+
+    @classmethod
+    async def update(cls, model_id: int, *options, **data):
+        cls.cache.discard_if(lambda user: user.id == model_id)
+        return await super().update(model_id, *options, **data)
+
+    @classmethod
+    async def revoke_tokens(cls, model_id: int):
+        return await cls.update(model_id,
+                                token_version=User.token_version + 1)
+
+    @classmethod
+    async def find_token_versions(cls) -> dict[str, int]:
+        async with cls.session() as session:
+            result = await session.execute(
+                select(User.email, User.token_version)
+                .where(User.token_version > 0)
+            )
+            return dict(result.all())
+
+    @classmethod
+    async def delete(cls, model_id: int):
+        cls.cache.discard_if(lambda user: user.id == model_id)
+        await super().delete(model_id)
 
 
 class Follow(Base):
@@ -47,9 +108,119 @@ class Follow(Base):
     following_user = relationship('User', foreign_keys=[following_id],
                                   back_populates='following')
 
-    __table_args__ = (UniqueConstraint('user_id', 'following_id',
-                                       name='unique_follow'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'following_id', name='unique_follow'),
+        Index('ix_follows_following_id_user_id', 'following_id', 'user_id'),
+    )
 
 
 class FollowDAO(BaseDAO):
     model = Follow
+    # Listings show the most recent subscriptions first.
+    keyset_descending = True
+    counters = (('following_id', User, 'follower_count'),
+                ('user_id', User, 'following_count'))
+
+    @classmethod
+    def counters_changed(cls, target, ids):
+        UsersDAO.cache.discard_if(lambda user: user.id in ids)
+
+    @classmethod
+    async def find_following_ids(cls, user_id: int) -> list[int]:
+        async with cls.session() as session:
+            result = await session.execute(
+                select(Follow.following_id).filter_by(user_id=user_id))
+            return result.scalars().all()
+
+    @classmethod
+    async def find_follower_pairs(cls, author_ids) -> list[tuple[int, int]]:
+        async with cls.session() as session:
+            result = await session.execute(
+                select(Follow.user_id, Follow.following_id)
+                .where(Follow.following_id.in_(author_ids))
+            )
+            return result.all()
+
+    @classmethod
+    async def unfollow(cls, user_id: int, username: str) -> bool:
+        following_id = (
+            select(User.id).filter_by(username=username).scalar_subquery())
+        deleted = await cls.delete_by(user_id=user_id,
+                                      following_id=following_id)
+        return bool(deleted)
+
+    @classmethod
+    async def find_following_status(cls, user_id: int,
+                                    usernames) -> dict[str, bool]:
+        async with cls.session() as session:
+            result = await session.execute(
+                select(User.username, Follow.id)
+                .outerjoin(Follow, and_(Follow.following_id == User.id,
+                                        Follow.user_id == user_id))
+                .where(User.username.in_(usernames))
+            )
+            following = {username for username, follow_id in result.all()
+                         if follow_id is not None}
+        return {username: username in following for username in usernames}
+
+
+class TokenFamily(Base):
+    __tablename__ = 'token_families'
+
+    # One family per login, every refresh rotates current_jti.
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'),
+                     nullable=False, index=True)
+    current_jti = Column(String(32), nullable=False)
+    created = Column(Timestamp, server_default=func.now())
+    expires_at = Column(Timestamp, nullable=False)
+    revoked_at = Column(Timestamp, nullable=True, index=True)
+
+
+class TokenFamilyDAO(BaseDAO):
+    model = TokenFamily
+
+    # Rotations and revocations commit on their own: a revocation has to
+    # survive the rollback of the request that detected token reuse.
+    @staticmethod
+    @asynccontextmanager
+    async def own_session():
+        async with async_session_maker() as session:
+            yield session
+
+    @classmethod
+    async def rotate(cls, family_id: str, jti: str, new_jti: str,
+                     expires_at) -> bool:
+        async with cls.own_session() as session:
+            result = await session.execute(
+                update(TokenFamily)
+                .where(TokenFamily.id == family_id,
+                       TokenFamily.current_jti == jti,
+                       TokenFamily.revoked_at.is_(None))
+                .values(current_jti=new_jti, expires_at=expires_at)
+            )
+            await session.commit()
+            return result.rowcount == 1
+
+    @classmethod
+    async def revoke(cls, *where) -> list[str]:
+        async with cls.own_session() as session:
+            result = await session.execute(
+                update(TokenFamily)
+                .where(*where, TokenFamily.revoked_at.is_(None))
+                .values(revoked_at=func.now())
+                .returning(TokenFamily.id)
+            )
+            revoked = result.scalars().all()
+            await session.commit()
+            return revoked
+
+    @classmethod
+    async def find_revoked_ids(cls) -> list[str]:
+        async with cls.session() as session:
+            result = await session.execute(
+                select(TokenFamily.id)
+                .where(TokenFamily.revoked_at.is_not(None),
+                       TokenFamily.expires_at > func.now())
+            )
+            return result.scalars().all()
@@ -1,12 +1,22 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, status, Depends, Body
+from typing import Literal
+from fastapi import (APIRouter, HTTPException, status, Depends, Body, Query,
+                     Request)
 
-from users.auth import (authenticate_user, create_token,
-                        get_token_payload, get_password_hash)
-from users.models import UsersDAO, FollowDAO
+from config import settings
+from feed.timeline import timelines
+from instrumentation import query_budget
+from ratelimit import limit_by_ip
+from users.auth import (authenticate_user, create_token, get_current_user,
+                        get_principal, get_token_payload, token_claims)
+from users.hashing import password_hasher
+from users.models import User, UsersDAO, FollowDAO
 from users.schemas import (SUserAuth, SUserRegister, SUserResponse,
-                           SFollowResponse, SCreateTokenResponse,
-                           SRefreshTokenResponse)
+                           SFollowResponse, SFollowListResponse,
+                           SCreateTokenResponse, SRefreshTokenResponse,
+                           SPrincipal)
+from users.tokens import (revoke_family, revoke_user_tokens, rotate_family,
+                          start_family)
 
 
 router = APIRouter(
@@ -14,6 +24,17 @@ router = APIRouter(
     tags=['Authorization & Users']
 )
 
+FOLLOW_USER_FIELDS = ('username', 'first_name', 'last_name',
+                      'follower_count', 'following_count')
+# Followers are reached through the user_id side of a subscription,
+# followed users through the following_id side.
+FOLLOW_LISTINGS = {
+    'followers': ('following_id', FollowDAO.projection('id', *(
+        (field, f'follower_user.{field}') for field in FOLLOW_USER_FIELDS))),
+    'following': ('user_id', FollowDAO.projection('id', *(
+        (field, f'following_user.{field}') for field in FOLLOW_USER_FIELDS)))
+}
+
 
 def user_answer(data):
     answer = SUserResponse(
@@ -23,7 +44,9 @@ def user_answer(data):
         date_joined=data.date_joined,
         first_name=data.first_name,
         last_name=data.last_name,
-        role=data.role
+        role=data.role,
+        follower_count=data.follower_count,
+        following_count=data.following_count
     )
     return answer
 
@@ -35,14 +58,17 @@ def user_answer(data):
     description=('Returns all subscriptions of the user who made the request. '
                  'Anonymous requests are not allowed.')
 )
-async def read_follow(current_user: dict = Depends(get_token_payload)):
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    follows = await FollowDAO.find_all('following_user', user_id=user.id)
+@query_budget(1)
+async def read_follow(principal: SPrincipal = Depends(get_principal)):
+    follows = await FollowDAO.find_all(
+        user_id=principal.uid,
+        **FollowDAO.projection(('following', 'following_user.username'))
+    )
 
     return (
         {
-            'user': user.username,
-            'following': follow.following_user.username
+            'user': principal.username,
+            'following': follow.following
         }
         for follow in follows
     )
@@ -58,9 +84,8 @@ async def read_follow(current_user: dict = Depends(get_token_payload)):
     )
 )
 async def subscription(following: str = Body(..., embed=True),
-                       current_user: dict = Depends(get_token_payload)):
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
-    if user.username == following:
+                       principal: SPrincipal = Depends(get_principal)):
+    if principal.username == following:
         raise HTTPException(status_code=400,
                             detail='You cannot follow yourself.')
 
@@ -69,23 +94,116 @@ async def subscription(following: str = Body(..., embed=True),
         raise HTTPException(status_code=404,
                             detail='There is no user with this name.')
 
-    followers = await FollowDAO.find_one_or_none(user_id=user.id,
-                                                 following_id=follow.id)
-    if followers:
+    # The unique constraint settles concurrent requests for the same pair.
+    created = await FollowDAO.add_or_ignore(user_id=principal.uid,
+                                            following_id=follow.id)
+    if not created:
         raise HTTPException(
             status_code=404,
             detail=f"You are already subscribed to '{following}'."
         )
 
-    await FollowDAO.add(user_id=user.id, following_id=follow.id)
-    return {'user': user.username, 'following': following}
+    timelines.invalidate(principal.uid)
+    return {'user': principal.username, 'following': following}
+
+
+@router.delete(
+    '/follow/{username}',
+    status_code=204,
+    summary='Unsubscription',
+    description=(
+        'Unsubscribes the user on whose behalf the request is made from the '
+        'specified user. Anonymous requests are not allowed.'
+    )
+)
+async def unsubscription(username: str,
+                         principal: SPrincipal = Depends(get_principal)):
+    if not await FollowDAO.unfollow(principal.uid, username):
+        raise HTTPException(
+            status_code=404,
+            detail=f"You are not subscribed to '{username}'."
+        )
+
+    timelines.invalidate(principal.uid)
+
+
+@router.get(
+    '/follow/check',
+    response_model=dict[str, bool],
+    summary='Check Subscriptions',
+    description=(
+        'Returns whether the user who made the request is subscribed to '
+        'each of the users passed in `username`. Unknown users are reported '
+        'as not followed. Anonymous requests are not allowed.'
+    )
+)
+@query_budget(1)
+async def check_follow(
+        username: list[str] = Query(
+            ..., max_length=settings.FOLLOW_CHECK_MAX_USERNAMES),
+        principal: SPrincipal = Depends(get_principal)
+):
+    return await FollowDAO.find_following_status(principal.uid, username)
+
+
+@router.get(
+    '/users/{username}/{listing}',
+    response_model=SFollowListResponse,
+    summary='Followers and Subscriptions',
+    description=(
+        'Returns the followers of a user or the users they are subscribed '
+        'to, most recent subscriptions first. Pages are linked through '
+        '`next` and `previous` cursors.'
+    )
+)
+@query_budget(2)
+async def read_follow_listing(
+        request: Request,
+        username: str,
+        listing: Literal['followers', 'following'],
+        limit: int = Query(
+            default=settings.PAGINATION_DEFAULT_LIMIT,
+            ge=settings.PAGINATION_DEFAULT_LIMIT_MIN,
+            le=settings.PAGINATION_DEFAULT_LIMIT_MAX
+        ),
+        cursor: str | None = Query(default=None)
+):
+    user = await UsersDAO.find_one_or_none(username=username)
+    if not user:
+        raise HTTPException(status_code=404,
+                            detail='There is no user with this name.')
+
+    column, projection = FOLLOW_LISTINGS[listing]
+    try:
+        page = await FollowDAO.find_all_with_keyset(
+            cursor=cursor, limit=limit, **{column: user.id}, **projection)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+
+    return {
+        'count': (user.follower_count if listing == 'followers'
+                  else user.following_count),
+        'next': (
+            str(request.url.include_query_params(cursor=page.next_cursor))
+            if page.next_cursor
+            else None
+        ),
+        'previous': (
+            str(request.url.include_query_params(
+                cursor=page.previous_cursor))
+            if page.previous_cursor
+            else None
+        ),
+        'results': [row._mapping for row in page.items]
+    }
 
 
 @router.post(
     '/jwt/create',
     response_model=SCreateTokenResponse,
     summary='Get JWT Token',
-    description='Retrieve a JWT token.'
+    description='Retrieve a JWT token.',
+    dependencies=[Depends(limit_by_ip('login'))]
 )
 async def login_user(user_data: SUserAuth):
     user = await authenticate_user(user_data.email, user_data.password)
@@ -93,9 +211,10 @@ async def login_user(user_data: SUserAuth):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
     await UsersDAO.update(model_id=user.id, last_login=datetime.utcnow())
-    access_token = create_token(data={'sub': str(user.email)},
-                                token_type='access')
-    refresh_token = create_token(data={'sub': str(user.email)},
+    family = await start_family(user.id)
+    access_token = create_token(data=token_claims(user) | {
+        'fam': family['fam']}, token_type='access')
+    refresh_token = create_token(data=token_claims(user) | family,
                                  token_type='refresh')
     return {'access': access_token, 'refresh': refresh_token,
             'token_type': 'Bearer'}
@@ -105,18 +224,65 @@ async def login_user(user_data: SUserAuth):
     '/jwt/refresh',
     response_model=SRefreshTokenResponse,
     summary='Refresh JWT Token',
-    description='Refresh a JWT token.'
+    description=(
+        'Refresh a JWT token. Every refresh token can be used once and is '
+        'replaced by the returned `refresh` token. Reusing a replaced token '
+        'revokes all tokens descending from the same login.'
+    ),
+    dependencies=[Depends(limit_by_ip('refresh'))]
 )
 async def refresh_token(refresh: str = Body(..., embed=True)):
     token_data = await get_token_payload(token=refresh)
 
-    if token_data['token_type'] != 'refresh':
+    if token_data.token_type != 'refresh':
         raise HTTPException(status_code=401,
                             detail='An invalid token was passed.')
 
-    access_token = create_token(data={'sub': token_data['sub']},
-                                token_type='access')
-    return {'access': access_token, 'token_type': 'Bearer'}
+    user = await UsersDAO.find_by_email(token_data.sub)
+    if not user or token_data.tv != user.token_version:
+        raise HTTPException(status_code=401,
+                            detail='Token has been revoked.')
+
+    if token_data.fam is None:
+        # Refresh tokens issued before rotation start a new family.
+        family = await start_family(user.id)
+    else:
+        family = await rotate_family(token_data.fam, token_data.jti)
+        if family is None:
+            raise HTTPException(status_code=401,
+                                detail='Token has been revoked.')
+
+    access_token = create_token(data=token_claims(user) | {
+        'fam': family['fam']}, token_type='access')
+    refresh_token = create_token(data=token_claims(user) | family,
+                                 token_type='refresh')
+    return {'access': access_token, 'refresh': refresh_token,
+            'token_type': 'Bearer'}
+
+
+@router.post(
+    '/jwt/revoke',
+    summary='Revoke JWT Token',
+    description=(
+        'Revoke a refresh token and the access tokens issued with it. With '
+        '`everywhere` every token of the user is revoked.'
+    )
+)
+async def revoke_token(refresh: str = Body(..., embed=True),
+                       everywhere: bool = Body(False, embed=True)):
+    token_data = await get_token_payload(token=refresh)
+
+    if token_data.token_type != 'refresh':
+        raise HTTPException(status_code=401,
+                            detail='An invalid token was passed.')
+
+    if everywhere:
+        user = await UsersDAO.find_by_email(token_data.sub)
+        if user:
+            await revoke_user_tokens(user.id)
+    elif token_data.fam is not None:
+        await revoke_family(token_data.fam)
+    return {}
 
 
 @router.post(
@@ -127,7 +293,7 @@ async def refresh_token(refresh: str = Body(..., embed=True)):
 async def verify_token(token: str = Body(..., embed=True)):
     token_data = await get_token_payload(token=token)
 
-    if token_data['token_type'] != 'access':
+    if token_data.token_type != 'access':
         raise HTTPException(status_code=401,
                             detail='An invalid token was passed.')
     return {}
@@ -137,7 +303,8 @@ async def verify_token(token: str = Body(..., embed=True)):
     '/register',
     response_model=SUserResponse,
     summary='New User Registration',
-    description='Register a new user.')
+    description='Register a new user.',
+    dependencies=[Depends(limit_by_ip('register'))])
 async def register_user(user_data: SUserRegister):
     existing_email = await UsersDAO.find_one_or_none(email=user_data.email)
     if existing_email:
@@ -153,7 +320,7 @@ async def register_user(user_data: SUserRegister):
             detail='A user with this name already exists.'
         )
 
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     new_user = await UsersDAO.add(
         email=user_data.email,
         password=hashed_password,
@@ -168,6 +335,5 @@ async def register_user(user_data: SUserRegister):
     summary='User Data',
     description='Data of the user who made the request.'
 )
-async def read_user_me(current_user: dict = Depends(get_token_payload)):
-    user = await UsersDAO.find_one_or_none(email=current_user['sub'])
+async def read_user_me(user: User = Depends(get_current_user)):
     return user_answer(user)
@@ -21,6 +21,8 @@ class SUserResponse(BaseModel):
     first_name: str | None
     last_name: str | None
     role: str
+    follower_count: int = 0
+    following_count: int = 0
 
 
 class SFollowResponse(BaseModel):
@@ -28,6 +30,21 @@ class SFollowResponse(BaseModel):
     following: str
 
 
+class SFollowUser(BaseModel):
+    username: str
+    first_name: str | None
+    last_name: str | None
+    follower_count: int
+    following_count: int
+
+
+class SFollowListResponse(BaseModel):
+    count: int
+    next: str | None = None
+    previous: str | None = None
+    results: list[SFollowUser]
+
+
 class SCreateTokenResponse(BaseModel):
     access: str
     refresh: str
@@ -36,4 +53,18 @@ class SCreateTokenResponse(BaseModel):
 
 class SRefreshTokenResponse(BaseModel):
     access: str
+    refresh: str
+    token_type: str
+
+
+class SPrincipal(BaseModel):
+    sub: str
     token_type: str
+    exp: int
+    uid: int | None = None
+    role: str | None = None
+    username: str | None = None
+    ver: int = 1
+    tv: int = 0
+    fam: str | None = None
+    jti: str | None = None
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from users.models import TokenFamily, TokenFamilyDAO, UsersDAO
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'tokens'
+# Compare-and-set of the current jti, so concurrent refreshes with the
+# same token cannot both rotate.
+REDIS_ROTATE = """
+if redis.call('HGET', KEYS[1], 'revoked') ~= '0'
+        or redis.call('HGET', KEYS[1], 'jti') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('PEXPIREAT', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def new_token_id() -> str:
+    return secrets.token_hex(16)
+
+
+def refresh_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(
+        days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+@dataclass
+class Family:
+    user_id: int
+    jti: str
+    expires_at: datetime
+    revoked: bool = False
+
+
+# Lives and dies with the process, so a restart ends every session.
+class MemoryTokenStore:
+    def __init__(self):
+        self._families = {}
+
+    async def create(self, family_id: str, user_id: int, jti: str,
+                     expires_at: datetime):
+        self._families[family_id] = Family(user_id, jti, expires_at)
+
+    async def rotate(self, family_id: str, jti: str, new_jti: str,
+                     expires_at: datetime) -> bool:
+        family = self._families.get(family_id)
+        if family is None or family.revoked or family.jti != jti:
+            return False
+        family.jti, family.expires_at = new_jti, expires_at
+        return True
+
+    async def revoke(self, family_id: str):
+        family = self._families.get(family_id)
+        if family is not None:
+            family.revoked = True
+
+    async def revoke_user(self, user_id: int) -> list[str]:
+        revoked = [family_id
+                   for family_id, family in self._families.items()
+                   if family.user_id == user_id and not family.revoked]
+        for family_id in revoked:
+            self._families[family_id].revoked = True
+        return revoked
+
+    async def find_revoked(self) -> list[str]:
+        now = datetime.now(timezone.utc)
+        self._families = {family_id: family
+                          for family_id, family in self._families.items()
+                          if family.expires_at > now}
+        return [family_id for family_id, family in self._families.items()
+                if family.revoked]
+
+
+class DatabaseTokenStore:
+    async def create(self, family_id: str, user_id: int, jti: str,
+                     expires_at: datetime):
+        await TokenFamilyDAO.add(id=family_id, user_id=user_id,
+                                 current_jti=jti, expires_at=expires_at)
+
+    async def rotate(self, family_id: str, jti: str, new_jti: str,
+                     expires_at: datetime) -> bool:
+        return await TokenFamilyDAO.rotate(family_id, jti, new_jti,
+                                           expires_at)
+
+    async def revoke(self, family_id: str):
+        await TokenFamilyDAO.revoke(TokenFamily.id == family_id)
+
+    async def revoke_user(self, user_id: int) -> list[str]:
+        return await TokenFamilyDAO.revoke(TokenFamily.user_id == user_id)
+
+    async def find_revoked(self) -> list[str]:
+        return await TokenFamilyDAO.find_revoked_ids()
+
+
+class RedisTokenStore:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('The redis token store requires the "redis" '
+                               'package.')
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._rotate = self._redis.register_script(REDIS_ROTATE)
+
+    @staticmethod
+    def _key(family_id: str) -> str:
+        return f'{REDIS_PREFIX}:family:{family_id}'
+
+    async def create(self, family_id: str, user_id: int, jti: str,
+                     expires_at: datetime):
+        user_key = f'{REDIS_PREFIX}:user:{user_id}'
+        expires_ms = int(expires_at.timestamp() * 1000)
+        async with self._redis.pipeline() as pipeline:
+            pipeline.hset(self._key(family_id), mapping={
+                'user_id': user_id, 'jti': jti, 'revoked': 0})
+            pipeline.pexpireat(self._key(family_id), expires_ms)
+            pipeline.sadd(user_key, family_id)
+            pipeline.pexpireat(user_key, expires_ms)
+            await pipeline.execute()
+
+    async def rotate(self, family_id: str, jti: str, new_jti: str,
+                     expires_at: datetime) -> bool:
+        return bool(await self._rotate(
+            keys=[self._key(family_id)],
+            args=[jti, new_jti, int(expires_at.timestamp() * 1000)]))
+
+    async def revoke(self, family_id: str):
+        key = self._key(family_id)
+        expires_ms = await self._redis.pexpiretime(key)
+        if expires_ms < 0:
+            return
+        async with self._redis.pipeline() as pipeline:
+            pipeline.hset(key, 'revoked', 1)
+            pipeline.zadd(f'{REDIS_PREFIX}:revoked', {family_id: expires_ms})
+            await pipeline.execute()
+
+    async def revoke_user(self, user_id: int) -> list[str]:
+        family_ids = await self._redis.smembers(
+            f'{REDIS_PREFIX}:user:{user_id}')
+        for family_id in family_ids:
+            await self.revoke(family_id)
+        return list(family_ids)
+
+    async def find_revoked(self) -> list[str]:
+        key = f'{REDIS_PREFIX}:revoked'
+        await self._redis.zremrangebyscore(key, '-inf',
+                                           int(time.time() * 1000))
+        return await self._redis.zrange(key, 0, -1)
+
+
+def create_token_store():
+    if settings.TOKEN_STORE == 'redis':
+        return RedisTokenStore(settings.TOKEN_STORE_REDIS_URL)
+    if settings.TOKEN_STORE == 'memory':
+        return MemoryTokenStore()
+    return DatabaseTokenStore()
+
+
+token_store = create_token_store()
+# Revoked, unexpired families, checked on every authenticated request.
+revocations = set()
+# Email -> lowest token version still accepted, for users whose tokens
+# were revoked all at once or whose role changed.
+token_versions = {}
+
+
+async def start_family(user_id: int) -> dict:
+    family_id, jti = new_token_id(), new_token_id()
+    await token_store.create(family_id, user_id, jti, refresh_expiry())
+    return {'fam': family_id, 'jti': jti}
+
+
+async def rotate_family(family_id: str, jti: str) -> dict | None:
+    new_jti = new_token_id()
+    if await token_store.rotate(family_id, jti, new_jti, refresh_expiry()):
+        return {'fam': family_id, 'jti': new_jti}
+
+    # An already rotated token came back: either holder may be an attacker,
+    # so the whole family goes.
+    await revoke_family(family_id)
+    return None
+
+
+async def revoke_family(family_id: str):
+    await token_store.revoke(family_id)
+    revocations.add(family_id)
+
+
+async def revoke_user_families(user_id: int):
+    for family_id in await token_store.revoke_user(user_id):
+        revocations.add(family_id)
+
+
+async def revoke_user_tokens(user_id: int):
+    await revoke_user_families(user_id)
+    # Also ends tokens issued outside a family.
+    user = await UsersDAO.revoke_tokens(user_id)
+    if user is not None:
+        token_versions[user.email] = user.token_version
+
+
+def is_revoked(principal) -> bool:
+    if principal.fam is not None and principal.fam in revocations:
+        return True
+    return principal.tv < token_versions.get(principal.sub, 0)
+
+
+async def sync_revocations():
+    # Picks up revocations made by other processes and drops expired ones.
+    revoked = await token_store.find_revoked()
+    versions = await UsersDAO.find_token_versions()
+    revocations.clear()
+    revocations.update(revoked)
+    token_versions.clear()
+    token_versions.update(versions)
+
+
+async def keep_revocations_synced(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_revocations()
+        except Exception:
+            logger.exception('Could not sync token revocations.')